@@ -0,0 +1,105 @@
+import math
+import os
+import threading
+import time
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_MAX_QUEUE_DEPTH = int(os.getenv("VIDEO_MAX_QUEUE_DEPTH", 100))
+VIDEO_DEFAULT_JOB_SECONDS = float(os.getenv("VIDEO_DEFAULT_JOB_SECONDS", 60))
+VIDEO_USER_BURST = int(os.getenv("VIDEO_USER_BURST", 5))
+VIDEO_USER_RATE_PER_MINUTE = float(os.getenv("VIDEO_USER_RATE_PER_MINUTE", 2))
+
+
+def _too_many_requests(detail: str, retry_after: float):
+    retry_after = min(retry_after, 24 * 3600)  # a bucket that never refills waits forever
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+# Per-user token buckets: each user can burst up to capacity requests,
+# then gets refill_per_second new ones
+class TokenBuckets:
+
+    def __init__(self, capacity: int = VIDEO_USER_BURST, refill_per_second: float = VIDEO_USER_RATE_PER_MINUTE / 60, max_users: int = 10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._buckets = {}  # user_id -> (tokens, updated_at)
+
+    def _tokens(self, user_id, now: float):
+        tokens, updated_at = self._buckets.get(user_id, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+    # Take one token, returns 0 on success or the seconds until one is available
+    def take(self, user_id) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(user_id, now)
+            if tokens < 1:
+                self._buckets[user_id] = (tokens, now)
+                if self.refill_per_second <= 0:
+                    return math.inf
+                return (1 - tokens) / self.refill_per_second
+            self._buckets[user_id] = (tokens - 1, now)
+            if len(self._buckets) > self.max_users:
+                self._prune(now)
+            return 0
+
+    # Give back a token taken for a request that was turned away for another reason
+    def refund(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            if user_id in self._buckets:
+                self._buckets[user_id] = (min(self.capacity, self._tokens(user_id, now) + 1), now)
+
+    # A full bucket is the same as no bucket, so those can be dropped
+    def _prune(self, now: float):
+        for user_id in [user_id for user_id in self._buckets if self._tokens(user_id, now) >= self.capacity]:
+            del self._buckets[user_id]
+
+
+# Rejects new generation work quickly once the backlog is more than we can finish,
+# telling clients when to come back from the queue depth and recent job durations
+class AdmissionController:
+
+    def __init__(self, max_queue_depth: int = VIDEO_MAX_QUEUE_DEPTH, buckets: TokenBuckets = None):
+        self.max_queue_depth = max_queue_depth
+        self.buckets = buckets or TokenBuckets()
+        self.rejected_queue_full = 0
+        self.rejected_quota = 0
+
+    # Per-user quota on the endpoint, raises 429 when the user's bucket is empty
+    def check_user(self, user_id):
+        wait = self.buckets.take(user_id)
+        if wait:
+            self.rejected_quota += 1
+            raise _too_many_requests("Too many video requests, please slow down.", wait)
+
+    # Raises 429 when the queue is full. parallel is how many jobs run at once and
+    # average_job_seconds the recent time per job, None if nothing has run yet.
+    # A user whose request was already counted by check_user gets the token back,
+    # a full queue is not their fault.
+    def check_queue(self, depth: int, parallel: int, average_job_seconds: float = None, user_id=None):
+        if depth < self.max_queue_depth:
+            return
+        self.rejected_queue_full += 1
+        if user_id is not None:
+            self.buckets.refund(user_id)
+        per_job = average_job_seconds or VIDEO_DEFAULT_JOB_SECONDS
+        # Time until the queue has drained back below the limit
+        retry_after = (depth - self.max_queue_depth + 1) / max(parallel, 1) * per_job
+        raise _too_many_requests("The video generation queue is full, please try again later.", retry_after)
+
+    def stats(self):
+        return {
+            "max_queue_depth": self.max_queue_depth,
+            "user_burst": self.buckets.capacity,
+            "user_rate_per_minute": self.buckets.refill_per_second * 60,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_quota": self.rejected_quota,
+        }
@@ -0,0 +1,34 @@
+"""Add in-flight key and leader to generation jobs
+
+Revision ID: a14b6c2f9e1a
+Revises: f3a05b1e8d09
+Create Date: 2026-10-18 22:04:17.529301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a14b6c2f9e1a'
+down_revision: Union[str, None] = 'f3a05b1e8d09'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_jobs', sa.Column('inflight_key', sa.String(length=64), nullable=True))
+    op.add_column('generation_jobs', sa.Column('leader_job_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_generation_jobs_inflight_key'), 'generation_jobs', ['inflight_key'], unique=True)
+    op.create_index(op.f('ix_generation_jobs_leader_job_id'), 'generation_jobs', ['leader_job_id'], unique=False)
+    op.create_foreign_key('fk_generation_jobs_leader_job_id', 'generation_jobs', 'generation_jobs', ['leader_job_id'], ['id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_generation_jobs_leader_job_id', 'generation_jobs', type_='foreignkey')
+    op.drop_index(op.f('ix_generation_jobs_leader_job_id'), table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_inflight_key'), table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'leader_job_id')
+    op.drop_column('generation_jobs', 'inflight_key')
@@ -0,0 +1,30 @@
+"""Add upscale status and path to generation_jobs
+
+Revision ID: a85b1c6e3f54
+Revises: f74a0b5d2e43
+Create Date: 2026-10-18 16:11:05.274190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a85b1c6e3f54'
+down_revision: Union[str, None] = 'f74a0b5d2e43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_jobs', sa.Column('upscale_status', sa.String(length=20), nullable=True))
+    op.add_column('generation_jobs', sa.Column('upscaled_video_path', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_generation_jobs_upscale_status'), 'generation_jobs', ['upscale_status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_jobs_upscale_status'), table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'upscaled_video_path')
+    op.drop_column('generation_jobs', 'upscale_status')
@@ -0,0 +1,26 @@
+"""Add timings to generation_jobs
+
+Revision ID: b96c2d7f4a65
+Revises: a85b1c6e3f54
+Create Date: 2026-10-18 16:48:21.903417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b96c2d7f4a65'
+down_revision: Union[str, None] = 'a85b1c6e3f54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_jobs', sa.Column('timings', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('generation_jobs', 'timings')
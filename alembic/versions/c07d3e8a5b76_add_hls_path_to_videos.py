@@ -0,0 +1,26 @@
+"""Add hls_path to videos
+
+Revision ID: c07d3e8a5b76
+Revises: b96c2d7f4a65
+Create Date: 2026-10-18 17:25:40.118362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c07d3e8a5b76'
+down_revision: Union[str, None] = 'b96c2d7f4a65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('hls_path', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'hls_path')
@@ -0,0 +1,28 @@
+"""Add poster and thumbnail paths to videos
+
+Revision ID: d18e4f9b6c87
+Revises: c07d3e8a5b76
+Create Date: 2026-10-18 17:58:12.640951
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd18e4f9b6c87'
+down_revision: Union[str, None] = 'c07d3e8a5b76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('poster_path', sa.String(length=255), nullable=True))
+    op.add_column('videos', sa.Column('thumbnail_path', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'thumbnail_path')
+    op.drop_column('videos', 'poster_path')
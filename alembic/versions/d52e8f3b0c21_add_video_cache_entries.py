@@ -0,0 +1,45 @@
+"""Add video cache entries
+
+Revision ID: d52e8f3b0c21
+Revises: c41d7e2a9b10
+Create Date: 2026-10-18 11:15:42.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52e8f3b0c21'
+down_revision: Union[str, None] = 'c41d7e2a9b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('video_cache_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('video_path', sa.String(length=255), nullable=False),
+    sa.Column('byte_size', sa.Integer(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_accessed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_video_cache_entries_id'), 'video_cache_entries', ['id'], unique=False)
+    op.create_index(op.f('ix_video_cache_entries_cache_key'), 'video_cache_entries', ['cache_key'], unique=True)
+    op.create_index(op.f('ix_video_cache_entries_last_accessed_at'), 'video_cache_entries', ['last_accessed_at'], unique=False)
+    op.add_column('generation_jobs', sa.Column('cache_key', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_generation_jobs_cache_key'), 'generation_jobs', ['cache_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_jobs_cache_key'), table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'cache_key')
+    op.drop_index(op.f('ix_video_cache_entries_last_accessed_at'), table_name='video_cache_entries')
+    op.drop_index(op.f('ix_video_cache_entries_cache_key'), table_name='video_cache_entries')
+    op.drop_index(op.f('ix_video_cache_entries_id'), table_name='video_cache_entries')
+    op.drop_table('video_cache_entries')
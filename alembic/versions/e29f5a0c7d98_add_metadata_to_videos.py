@@ -0,0 +1,36 @@
+"""Add prompt and file metadata to videos
+
+Revision ID: e29f5a0c7d98
+Revises: d18e4f9b6c87
+Create Date: 2026-10-18 18:31:57.082214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e29f5a0c7d98'
+down_revision: Union[str, None] = 'd18e4f9b6c87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('prompt', sa.Text(), nullable=True))
+    op.add_column('videos', sa.Column('byte_size', sa.BigInteger(), nullable=True))
+    op.add_column('videos', sa.Column('duration_seconds', sa.Float(), nullable=True))
+    op.add_column('videos', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('videos', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('videos', sa.Column('fps', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'fps')
+    op.drop_column('videos', 'height')
+    op.drop_column('videos', 'width')
+    op.drop_column('videos', 'duration_seconds')
+    op.drop_column('videos', 'byte_size')
+    op.drop_column('videos', 'prompt')
@@ -0,0 +1,26 @@
+"""Add quality to generation jobs
+
+Revision ID: e63f9a4c1d32
+Revises: d52e8f3b0c21
+Create Date: 2026-10-18 13:40:05.117362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e63f9a4c1d32'
+down_revision: Union[str, None] = 'd52e8f3b0c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('generation_jobs', sa.Column('quality', sa.String(length=20), server_default='standard', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('generation_jobs', 'quality')
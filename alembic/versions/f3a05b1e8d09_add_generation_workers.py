@@ -0,0 +1,39 @@
+"""Add generation workers and job ownership
+
+Revision ID: f3a05b1e8d09
+Revises: e29f5a0c7d98
+Create Date: 2026-10-18 21:12:40.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a05b1e8d09'
+down_revision: Union[str, None] = 'e29f5a0c7d98'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('generation_workers',
+    sa.Column('id', sa.String(length=100), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_generation_workers_heartbeat_at'), 'generation_workers', ['heartbeat_at'], unique=False)
+    op.add_column('generation_jobs', sa.Column('worker_id', sa.String(length=100), nullable=True))
+    op.add_column('generation_jobs', sa.Column('claim_token', sa.String(length=32), nullable=True))
+    op.create_index(op.f('ix_generation_jobs_worker_id'), 'generation_jobs', ['worker_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_generation_jobs_worker_id'), table_name='generation_jobs')
+    op.drop_column('generation_jobs', 'claim_token')
+    op.drop_column('generation_jobs', 'worker_id')
+    op.drop_index(op.f('ix_generation_workers_heartbeat_at'), table_name='generation_workers')
+    op.drop_table('generation_workers')
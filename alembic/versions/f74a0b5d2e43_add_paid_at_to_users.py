@@ -0,0 +1,26 @@
+"""Add paid_at to users
+
+Revision ID: f74a0b5d2e43
+Revises: e63f9a4c1d32
+Create Date: 2026-10-18 15:02:48.631904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f74a0b5d2e43'
+down_revision: Union[str, None] = 'e63f9a4c1d32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('paid_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'paid_at')
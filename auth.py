@@ -14,6 +14,7 @@ from user_email import send_account_activation_confirmation_email, send_password
 import os
 from user_email import USER_VERIFY_ACCOUNT, FORGOT_PASSWORD
 from user_videos import create_video
+from prompt_filter import prompt_filter
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,6 +34,7 @@ REFRESH_TOKEN_EXPIRE_MINUTES = int(os.environ["REFRESH_TOKEN_EXPIRE_MINUTES"])
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # Dependency for database session
 def get_db():
@@ -90,6 +92,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     raise HTTPException(status_code=401, detail="Not authorised.")
 
 
+# Get current user from a token if one was sent, None for anonymous requests
+async def get_optional_current_user(token: str = Depends(optional_oauth2_scheme), db: Session = Depends(get_db)):
+    if not token:
+        return None
+    return await get_token_user(token=token, db=db)
+
+
 # Fetch user details
 async def fetch_user_detail(pk, session):
     user = session.query(User).filter(User.id == pk).first()
@@ -293,29 +302,43 @@ async def get_login_token(data, db):
 # text prompt validation to generate videos
 async def validate_prompt(text_prompt: str, user_id: int, db):
 
-    output_folder_path = 'static/output_video'
-
     if not text_prompt.text:
         raise HTTPException(status_code=400, detail="Text prompt is missing or empty.")
+
+    # Reject junk and blocklisted prompts before they take a generation slot
+    rejection = prompt_filter.check(text_prompt.text)
+    if rejection is not None:
+        raise HTTPException(status_code=400, detail=rejection)
     
     prompt = text_prompt.text
     print(f'Text Prompt: {prompt}')
 
-    # Perform video generation based on the text prompt
-    # Assuming create_video function is defined elsewhere
-    video_path = await create_video(prompt, user_id, db)
-    
-    # Placeholder logic for demonstration
-    generated_video_url = os.path.join(output_folder_path, os.path.basename(video_path))
-    return {"video_url": generated_video_url}
+    # Queue the video generation, the client polls /jobs/{job_id} for the result
+    job = await create_video(prompt, user_id, db, quality=text_prompt.quality)
+    return {"job_id": job.id, "status": job.status, "video_url": job.video_path}
 
 
 # retrive videos from user id
 async def retrieve_video(user_id: int, db: Session):
 
     videos = db.query(Video).filter(Video.user_id == user_id).all()
-    # Extract the video paths
-    video_paths = [video.video_path for video in videos]
-    
-    return video_paths
+
+    # Previews are linked directly when they exist, otherwise the thumbnail endpoint makes them
+    return [
+        {
+            "video_id": video.id,
+            "video_path": video.video_path,
+            "poster_url": f"/{video.poster_path}" if video.poster_path else None,
+            "thumbnail_url": f"/{video.thumbnail_path}" if video.thumbnail_path else f"/videos/{video.id}/thumbnail",
+            "hls_url": f"/{video.hls_path}" if video.hls_path else None,
+            "prompt": video.prompt,
+            "byte_size": video.byte_size,
+            "duration_seconds": video.duration_seconds,
+            "width": video.width,
+            "height": video.height,
+            "fps": video.fps,
+            "created_at": video.created_at,
+        }
+        for video in videos
+    ]
 
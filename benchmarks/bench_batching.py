@@ -0,0 +1,57 @@
+"""Compare video generation throughput with and without micro-batching.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_batching --prompts 4
+
+Each prompt is rendered on its own first, then all prompts are rendered in a
+single pipeline call. The model is loaded once before timing starts.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from user_videos import render_videos
+from video_pipeline import get_pipeline_pool
+
+
+DEMO_PROMPTS = [
+    "A panda eating bamboo on a rock",
+    "Waves crashing on a beach at sunset",
+    "A red car driving through a snowy forest",
+    "Timelapse of clouds over a mountain range",
+]
+
+
+def run(prompts, batched, output_dir):
+    output_names = [os.path.join(output_dir, f"bench_{index}.mp4") for index in range(len(prompts))]
+    started = time.perf_counter()
+    if batched:
+        render_videos(prompts, output_names)
+    else:
+        for prompt, output_name in zip(prompts, output_names):
+            render_videos([prompt], [output_name])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=4, help="number of prompts per run")
+    args = parser.parse_args()
+
+    prompts = [DEMO_PROMPTS[index % len(DEMO_PROMPTS)] for index in range(args.prompts)]
+    get_pipeline_pool().warm_up()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        unbatched = run(prompts, batched=False, output_dir=output_dir)
+        batched = run(prompts, batched=True, output_dir=output_dir)
+
+    print(f"prompts:    {len(prompts)}")
+    print(f"unbatched:  {unbatched:.1f}s  {len(prompts) / unbatched:.3f} videos/s")
+    print(f"batched:    {batched:.1f}s  {len(prompts) / batched:.3f} videos/s")
+    print(f"speedup:    {unbatched / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Report seconds per denoising step for each device profile.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_device_profiles --profiles cpu cpu-bf16
+
+Every profile runs in its own process because torch thread counts can only be
+set once per process.
+"""
+import argparse
+import dataclasses
+import statistics
+import subprocess
+import sys
+import time
+
+
+def measure(profile_name, steps, prompt):
+    from diffusers_backend import DiffusersBackend, get_device_profile
+    from user_videos import QUALITY_PRESETS
+    from video_pipeline import VIDEO_MODEL_ID
+
+    load_started = time.perf_counter()
+    backend = DiffusersBackend(VIDEO_MODEL_ID, get_device_profile(profile_name))
+    backend.load()
+    load_seconds = time.perf_counter() - load_started
+
+    step_times = []
+    last = [time.perf_counter()]
+
+    def record_step(step, timestep, latents):
+        now = time.perf_counter()
+        step_times.append(now - last[0])
+        last[0] = now
+
+    params = dataclasses.replace(QUALITY_PRESETS["draft"], num_inference_steps=steps)
+    last[0] = time.perf_counter()
+    backend.generate([prompt], params, callback=record_step)
+
+    # The first step includes one-off warm-up such as torch.compile
+    steady = step_times[1:] or step_times
+    print(f"{profile_name:<10} load {load_seconds:>6.1f}s  first step {step_times[0]:>6.2f}s  "
+          f"{statistics.mean(steady):>6.2f}s/step  (best {min(steady):.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=["cpu", "cpu-bf16"])
+    parser.add_argument("--steps", type=int, default=6)
+    parser.add_argument("--prompt", default="A panda eating bamboo on a rock")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        measure(args.single, args.steps, args.prompt)
+        return
+
+    for profile_name in args.profiles:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_device_profiles", "--single", profile_name,
+             "--steps", str(args.steps), "--prompt", args.prompt],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Measure generation latency for each quality mode.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_quality --runs 3
+
+Every mode renders the same prompt a few times on a warm pipeline and reports
+the mean and best wall time, which is what users wait for once a worker is free.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from user_videos import QUALITY_PRESETS, render_videos
+from video_pipeline import get_pipeline_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="renders per quality mode")
+    parser.add_argument("--prompt", default="A panda eating bamboo on a rock")
+    args = parser.parse_args()
+
+    get_pipeline_pool().warm_up()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_name = os.path.join(output_dir, "bench.mp4")
+        print(f"{'quality':<10} {'steps':>5} {'size':>9} {'frames':>6} {'mean':>8} {'best':>8}")
+        for quality, params in QUALITY_PRESETS.items():
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                render_videos([args.prompt], [output_name], params)
+                timings.append(time.perf_counter() - started)
+            size = f"{params.width}x{params.height}"
+            print(f"{quality:<10} {params.num_inference_steps:>5} {size:>9} {params.num_frames:>6} "
+                  f"{statistics.mean(timings):>7.1f}s {min(timings):>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
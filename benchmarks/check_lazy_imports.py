@@ -0,0 +1,92 @@
+"""Check that the API modules import without pulling in the inference stack.
+
+Run from the repository root, for example in CI:
+
+    python -m benchmarks.check_lazy_imports
+
+Each module is imported in a fresh interpreter. The script prints its import
+time and exits with status 1 if any of the heavy packages below ended up in
+sys.modules, which would slow down startup of every API process again.
+
+crud is imported first in every probe, as main does: security and auth can not
+be imported on their own because of the security -> crud -> user_email ->
+security cycle. Importing main creates the tables, so the probes run against a
+throwaway in-memory SQLite database, and settings that are not in the
+environment get placeholder values.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("torch", "diffusers", "transformers", "accelerate", "safetensors", "PIL", "cv2", "numpy")
+
+# The auth, payment and job modules that every API process imports at startup, and the app itself
+DEFAULT_MODULES = ("auth", "user_payment", "crud", "security", "user_videos", "main")
+
+# Enough configuration for the modules to import, nothing is connected to
+PROBE_ENV = {
+    "APP_NAME": "check_lazy_imports",
+    "SECRET_KEY": "placeholder",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "REFRESH_TOKEN_EXPIRE_MINUTES": "60",
+    "STRIPE_SECRET_KEY": "placeholder",
+    "STRIPE_WEBHOOK_SECRET": "placeholder",
+}
+
+PROBE = """
+import importlib, json, sys
+importlib.import_module("crud")
+importlib.import_module(sys.argv[1])
+heavy = sys.argv[2].split(",")
+print(json.dumps(sorted(name for name in sys.modules if name.split(".")[0] in heavy)))
+"""
+
+
+def probe_env():
+    env = {**PROBE_ENV, **os.environ}
+    env["DATABASE_URL"] = "sqlite://"
+    # preload mode loads the pipelines when main is imported, on purpose
+    env["VIDEO_WEIGHTS_MODE"] = "private"
+    return env
+
+
+def check_module(module: str):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, module, ",".join(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        env=probe_env(),
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        return elapsed, None, completed.stderr.strip().splitlines()[-1:] or ["import failed"]
+    loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    return elapsed, sorted({name.split(".")[0] for name in loaded}), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        elapsed, heavy, error = check_module(module)
+        if error is not None:
+            print(f"{module:<16} {elapsed:6.2f}s  ERROR {error[0]}")
+            failed = True
+        elif heavy:
+            print(f"{module:<16} {elapsed:6.2f}s  FAIL imports {', '.join(heavy)}")
+            failed = True
+        else:
+            print(f"{module:<16} {elapsed:6.2f}s  ok")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Check the S3 storage backend against a local S3 compatible server.
+
+Start a stand-in server and create a bucket, for example MinIO:
+
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 minio/minio server /data
+
+or the moto server (pip install "moto[server]"):
+
+    moto_server -p 9000
+
+then run from the repository root:
+
+    AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 \
+    VIDEO_STORAGE_BACKEND=s3 VIDEO_S3_BUCKET=videos VIDEO_S3_ENDPOINT_URL=http://localhost:9000 \
+    python -m benchmarks.check_storage_s3 --create-bucket
+
+The script publishes a file through the backend, downloads it again through the
+signed URL that /download_video would redirect to, and exits with status 1 if
+the bytes or the download headers differ.
+"""
+import argparse
+import os
+import sys
+import urllib.request
+
+import video_storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--create-bucket", action="store_true", help="create VIDEO_S3_BUCKET first")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="bytes in the test file")
+    args = parser.parse_args()
+
+    backend = video_storage.get_storage_backend()
+    if backend.name != "s3":
+        sys.exit("Set VIDEO_STORAGE_BACKEND=s3 and the VIDEO_S3_* variables.")
+    if args.create_bucket:
+        try:
+            backend.client.create_bucket(Bucket=backend.bucket)
+        except backend.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    path = video_storage.new_path()
+    content = os.urandom(args.size)
+    with open(path, "wb") as file:
+        file.write(content)
+
+    failed = False
+    try:
+        backend.publish(path)
+        url = backend.download_url(path, os.path.basename(path))
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+            disposition = response.headers.get("Content-Disposition", "")
+            content_type = response.headers.get("Content-Type")
+
+        checks = {
+            "bytes match": body == content,
+            "attachment disposition": disposition.startswith("attachment"),
+            "video/mp4 content type": content_type == "video/mp4",
+        }
+        for name, ok in checks.items():
+            print(f"{name:<24} {'ok' if ok else 'FAIL'}")
+            failed = failed or not ok
+    finally:
+        os.remove(path)
+        backend.client.delete_object(Bucket=backend.bucket, Key=backend.key(path))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Load test the generation queue, encoder, storage and database with the stub backend.
+
+Run from the repository root against a scratch database:
+
+    DATABASE_URL=... python -m benchmarks.load_test_stub --user-id 1 --jobs 200
+
+Jobs are created and queued the same way /generate_video does it, then the
+script waits for all of them and reports throughput and latency percentiles.
+Set VIDEO_STUB_STEP_SECONDS to mimic the real per-step cost.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ["VIDEO_BACKEND"] = "stub"
+# One user submits every job, so lift the per-user quota and queue limit
+os.environ.setdefault("VIDEO_USER_BURST", "1000000")
+os.environ.setdefault("VIDEO_MAX_QUEUE_DEPTH", "1000000")
+
+import crud  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from user_videos import create_video, start_generation_workers  # noqa: E402
+from video_jobs import JOB_DONE, JOB_FINISHED_STATUSES  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def submit_jobs(user_id, count, quality, unique):
+    db = SessionLocal()
+    try:
+        job_ids = []
+        for index in range(count):
+            prompt = f"load test prompt {index}" if unique else "load test prompt"
+            job = await create_video(prompt, user_id, db, quality=quality)
+            job_ids.append(job.id)
+        return job_ids
+    finally:
+        db.close()
+
+
+def wait_for(job_ids, poll_seconds):
+    remaining = set(job_ids)
+    jobs = {}
+    while remaining:
+        time.sleep(poll_seconds)
+        db = SessionLocal()
+        try:
+            for job_id in list(remaining):
+                job = crud.get_generation_job(db, job_id)
+                if job.status in JOB_FINISHED_STATUSES:
+                    jobs[job_id] = (job.status, job.created_at, job.finished_at)
+                    remaining.discard(job_id)
+        finally:
+            db.close()
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", type=int, required=True, help="existing user that owns the jobs")
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--quality", default="draft")
+    parser.add_argument("--repeat-prompt", action="store_true", help="submit one prompt to exercise the cache and deduplication")
+    parser.add_argument("--poll", type=float, default=0.2)
+    args = parser.parse_args()
+
+    start_generation_workers()
+    started = time.perf_counter()
+    job_ids = asyncio.run(submit_jobs(args.user_id, args.jobs, args.quality, unique=not args.repeat_prompt))
+    jobs = wait_for(job_ids, args.poll)
+    elapsed = time.perf_counter() - started
+
+    latencies = [(finished - created).total_seconds() for _, created, finished in jobs.values()]
+    done = sum(1 for status, _, _ in jobs.values() if status == JOB_DONE)
+    print(f"jobs:        {len(jobs)} ({done} done)")
+    print(f"wall time:   {elapsed:.1f}s")
+    print(f"throughput:  {len(jobs) / elapsed:.2f} jobs/s")
+    print(f"latency p50: {percentile(latencies, 0.5):.2f}s  p95: {percentile(latencies, 0.95):.2f}s  "
+          f"mean: {statistics.mean(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import uuid
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 import models, schemas
 from security import hash_password
 from user_email import send_account_verification_email
@@ -74,3 +77,250 @@ def update_user_logout_time(db: Session, user_id: int):
     else:
         print("User token not found.")
 
+
+
+# Create a queued video generation job, held by the worker process that queues it
+def create_generation_job(db: Session, user_id: int, prompt: str, cache_key: str = None, quality: str = "standard", worker_id: str = None):
+    db_job = models.GenerationJob(user_id=user_id, prompt=prompt, status="queued", cache_key=cache_key, quality=quality, worker_id=worker_id)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+# Retrieve a generation job by id.
+def get_generation_job(db: Session, job_id: int):
+    return db.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).first()
+
+
+# Move queued jobs to running for a worker, skipping any that were cancelled or taken meanwhile.
+# Each claim writes a token of its own, so only the rows this call moved are returned.
+def claim_generation_jobs(db: Session, job_ids: list, worker_id: str = None):
+    token = uuid.uuid4().hex
+    db.query(models.GenerationJob).filter(
+        models.GenerationJob.id.in_(job_ids),
+        models.GenerationJob.status == "queued",
+    ).update({"status": "running", "started_at": datetime.now(), "worker_id": worker_id, "claim_token": token}, synchronize_session=False)
+    db.commit()
+    jobs = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id.in_(job_ids),
+        models.GenerationJob.claim_token == token,
+    ).all()
+    order = {job_id: index for index, job_id in enumerate(job_ids)}
+    return sorted(jobs, key=lambda job: order[job.id])
+
+
+# Move a job's upscale from queued to running, returns the job or None if it was not queued.
+def claim_upscale_job(db: Session, job_id: int, worker_id: str = None):
+    updated = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id == job_id,
+        models.GenerationJob.upscale_status == "queued",
+    ).update({"upscale_status": "running", "worker_id": worker_id}, synchronize_session=False)
+    db.commit()
+    if not updated:
+        return None
+    return get_generation_job(db, job_id)
+
+
+# Record that a worker process is still alive, registering it on its first beat.
+def beat_generation_worker(db: Session, worker_id: str):
+    updated = db.query(models.GenerationWorker).filter(
+        models.GenerationWorker.id == worker_id,
+    ).update({"heartbeat_at": datetime.now()}, synchronize_session=False)
+    if not updated:
+        db.add(models.GenerationWorker(id=worker_id))
+    db.commit()
+
+
+# Ids of the workers that have beaten since the given time.
+def get_live_generation_workers(db: Session, since: datetime):
+    return [worker_id for worker_id, in db.query(models.GenerationWorker.id).filter(models.GenerationWorker.heartbeat_at >= since).all()]
+
+
+# Forget a worker that stopped, or every worker that has not beaten since the given time.
+def remove_generation_workers(db: Session, worker_id: str = None, before: datetime = None):
+    query = db.query(models.GenerationWorker)
+    if worker_id is not None:
+        query = query.filter(models.GenerationWorker.id == worker_id)
+    if before is not None:
+        query = query.filter(models.GenerationWorker.heartbeat_at < before)
+    query.delete(synchronize_session=False)
+    db.commit()
+
+
+# Jobs not held by any of the live workers, including jobs from before workers were recorded.
+def _orphaned(live_worker_ids: list):
+    return or_(models.GenerationJob.worker_id.is_(None), models.GenerationJob.worker_id.notin_(live_worker_ids))
+
+
+# Fail the running jobs and upscales of workers that are gone, they can not be resumed.
+# Runs that went on after a cancellation stop being in flight too.
+def fail_orphaned_generation_jobs(db: Session, live_worker_ids: list, error: str):
+    failed = db.query(models.GenerationJob).filter(
+        models.GenerationJob.status == "running",
+        _orphaned(live_worker_ids),
+    ).update({"status": "failed", "error": error, "finished_at": datetime.now(), "inflight_key": None}, synchronize_session=False)
+    db.query(models.GenerationJob).filter(
+        models.GenerationJob.status == "cancelled",
+        models.GenerationJob.inflight_key.isnot(None),
+        _orphaned(live_worker_ids),
+    ).update({"inflight_key": None}, synchronize_session=False)
+    failed += db.query(models.GenerationJob).filter(
+        models.GenerationJob.upscale_status == "running",
+        _orphaned(live_worker_ids),
+    ).update({"upscale_status": "failed"}, synchronize_session=False)
+    db.commit()
+    return failed
+
+
+# Take over the queued jobs, or queued upscales, of workers that are gone.
+# Followers are not queued anywhere, they stay with their leader.
+# Returns only the jobs this call took, oldest first.
+def adopt_generation_jobs(db: Session, live_worker_ids: list, worker_id: str, upscales: bool = False):
+    token = uuid.uuid4().hex
+    status_column = models.GenerationJob.upscale_status if upscales else models.GenerationJob.status
+    queued = (status_column == "queued") & models.GenerationJob.leader_job_id.is_(None)
+    db.query(models.GenerationJob).filter(
+        queued,
+        _orphaned(live_worker_ids),
+    ).update({"worker_id": worker_id, "claim_token": token}, synchronize_session=False)
+    db.commit()
+    return db.query(models.GenerationJob).filter(
+        queued,
+        models.GenerationJob.claim_token == token,
+    ).order_by(models.GenerationJob.id).all()
+
+
+# Followers waiting for a link to the given job's upscaled video, oldest first.
+def get_upscale_waiters(db: Session, job_id: int):
+    return db.query(models.GenerationJob).filter(
+        models.GenerationJob.leader_job_id == job_id,
+        models.GenerationJob.upscale_status == "queued",
+    ).order_by(models.GenerationJob.id).all()
+
+
+# Fail the queued upscales of followers whose leader's upscale failed without them,
+# for example because its worker died, they would wait forever.
+def fail_stranded_upscales(db: Session):
+    leader = aliased(models.GenerationJob)
+    # MySQL can not update a table it selects from in the same statement
+    job_ids = [job_id for job_id, in db.query(models.GenerationJob.id).join(leader, models.GenerationJob.leader_job_id == leader.id).filter(
+        models.GenerationJob.upscale_status == "queued",
+        leader.upscale_status == "failed",
+    ).all()]
+    if job_ids:
+        db.query(models.GenerationJob).filter(
+            models.GenerationJob.id.in_(job_ids),
+            models.GenerationJob.upscale_status == "queued",
+        ).update({"upscale_status": "failed"}, synchronize_session=False)
+    db.commit()
+    return len(job_ids)
+
+
+# The job whose run for the cache key is queued or running, None if there is none.
+# With lock the row stays locked until the caller commits, so it can not finish meanwhile.
+def get_inflight_job(db: Session, cache_key: str, lock: bool = False):
+    query = db.query(models.GenerationJob).filter(models.GenerationJob.inflight_key == cache_key)
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+
+# Make a queued job the one run for its cache key. False when the job is not queued
+# or already leads, or when another job holds the key, the unique index decides races.
+def lead_generation_job(db: Session, job_id: int, cache_key: str, worker_id: str = None):
+    try:
+        updated = db.query(models.GenerationJob).filter(
+            models.GenerationJob.id == job_id,
+            models.GenerationJob.status == "queued",
+            models.GenerationJob.inflight_key.is_(None),
+        ).update({"inflight_key": cache_key, "leader_job_id": None, "worker_id": worker_id}, synchronize_session=False)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return updated == 1
+
+
+# Attach a queued job that leads nothing to another job's run, returns True on success.
+def follow_generation_job(db: Session, job_id: int, leader_job_id: int):
+    updated = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id == job_id,
+        models.GenerationJob.status == "queued",
+        models.GenerationJob.inflight_key.is_(None),
+    ).update({"leader_job_id": leader_job_id}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+# The end of a job's run, identical requests start a new one from now on.
+def release_inflight_job(db: Session, job_id: int):
+    db.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).update({"inflight_key": None}, synchronize_session=False)
+    db.commit()
+
+
+# Queued followers of a job, oldest first.
+def get_generation_job_followers(db: Session, leader_job_id: int):
+    return db.query(models.GenerationJob).filter(
+        models.GenerationJob.leader_job_id == leader_job_id,
+        models.GenerationJob.status == "queued",
+    ).order_by(models.GenerationJob.id).all()
+
+
+# Queued followers whose leader's run ended before the given time without handing
+# them a result, for example because its worker died.
+def get_stranded_generation_jobs(db: Session, before: datetime):
+    leader = aliased(models.GenerationJob)
+    return db.query(models.GenerationJob).join(leader, models.GenerationJob.leader_job_id == leader.id).filter(
+        models.GenerationJob.status == "queued",
+        leader.inflight_key.is_(None),
+        leader.finished_at < before,
+    ).order_by(models.GenerationJob.id).all()
+
+
+# Ids among the given jobs that were cancelled, by any process, and have no queued followers left.
+def get_abandoned_generation_job_ids(db: Session, job_ids: list):
+    cancelled = {job_id for job_id, in db.query(models.GenerationJob.id).filter(
+        models.GenerationJob.id.in_(job_ids),
+        models.GenerationJob.status == "cancelled",
+    ).all()}
+    if not cancelled:
+        return cancelled
+    followed = {leader_job_id for leader_job_id, in db.query(models.GenerationJob.leader_job_id).filter(
+        models.GenerationJob.leader_job_id.in_(cancelled),
+        models.GenerationJob.status == "queued",
+    ).distinct().all()}
+    return cancelled - followed
+
+
+# Move a job on from the expected status with the given values, if it is still in it.
+# Commits and returns True on success, otherwise rolls the session back and returns False.
+def transition_generation_job(db: Session, job_id: int, from_status: str, **values):
+    updated = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id == job_id,
+        models.GenerationJob.status == from_status,
+    ).update(values, synchronize_session=False)
+    if updated != 1:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+# Cancel a job only if it is still in the expected status, returns True on success.
+def cancel_generation_job(db: Session, job_id: int, from_status: str):
+    updated = db.query(models.GenerationJob).filter(
+        models.GenerationJob.id == job_id,
+        models.GenerationJob.status == from_status,
+    ).update({"status": "cancelled", "finished_at": datetime.now()}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
+
+# Record a successful payment so the user's generation jobs get priority.
+def mark_user_paid(db: Session, user_id: int):
+    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if db_user:
+        db_user.paid_at = datetime.now()
+        db.commit()
+    return db_user
@@ -0,0 +1,251 @@
+import gc
+import os
+from contextlib import nullcontext
+from dataclasses import dataclass
+import torch
+from diffusers import DiffusionPipeline, DPMSolverMultistepScheduler, VideoToVideoSDPipeline
+from dotenv import load_dotenv
+from PIL import Image
+from prompt_embeddings import encode_prompts
+from video_backends import InferenceBackend, VIDEO_WEIGHTS_MODE
+
+load_dotenv()
+
+
+# Schedulers a generation can ask for, "default" is the one the model ships with
+SCHEDULERS = {
+    "dpm++": (DPMSolverMultistepScheduler, {}),
+    "dpm++-karras": (DPMSolverMultistepScheduler, {"use_karras_sigmas": True}),
+}
+
+
+# Switch a loaded pipeline to the named scheduler, built from the model's own config
+def use_scheduler(pipe, name: str = "default"):
+    current = getattr(pipe, "scheduler_name", "default")
+    if name == current:
+        return
+    if name == "default":
+        pipe.scheduler = pipe.default_scheduler
+    elif name in SCHEDULERS:
+        scheduler_class, options = SCHEDULERS[name]
+        pipe.scheduler = scheduler_class.from_config(pipe.default_scheduler.config, **options)
+    else:
+        raise ValueError(f"Unknown scheduler '{name}'.")
+    pipe.scheduler_name = name
+
+
+# How a pipeline is placed and tuned on the host, chosen once per process
+@dataclass(frozen=True)
+class DeviceProfile:
+    name: str
+    device: str
+    dtype: torch.dtype
+    cpu_offload: bool = False
+    intra_op_threads: int = None  # torch defaults when None
+    inter_op_threads: int = None
+    channels_last: bool = False  # applied to the VAE only
+    compile: bool = False
+    attention_slicing: bool = False
+    forward_chunking: bool = True
+    vae_slicing: bool = True
+
+
+_cpu_threads = int(os.getenv("TORCH_INTRA_OP_THREADS", os.cpu_count() or 1))
+_cpu_inter_op_threads = int(os.getenv("TORCH_INTER_OP_THREADS", 1))
+_torch_compile = os.getenv("VIDEO_TORCH_COMPILE", "false").lower() == "true"
+
+DEVICE_PROFILES = {
+    # fp16 weights, moved to the GPU one model at a time
+    "gpu": DeviceProfile(name="gpu", device="cuda", dtype=torch.float16, cpu_offload=True),
+    # GPU-less hosts, bf16 halves memory traffic on CPUs with native support
+    "cpu-bf16": DeviceProfile(
+        name="cpu-bf16",
+        device="cpu",
+        dtype=torch.bfloat16,
+        intra_op_threads=_cpu_threads,
+        inter_op_threads=_cpu_inter_op_threads,
+        channels_last=True,
+        compile=_torch_compile,
+        attention_slicing=True,
+    ),
+    "cpu": DeviceProfile(
+        name="cpu",
+        device="cpu",
+        dtype=torch.float32,
+        intra_op_threads=_cpu_threads,
+        inter_op_threads=_cpu_inter_op_threads,
+        channels_last=True,
+        compile=_torch_compile,
+        attention_slicing=True,
+    ),
+}
+
+
+def _default_profile_name():
+    return "gpu" if torch.cuda.is_available() else "cpu"
+
+
+VIDEO_DEVICE_PROFILE = os.getenv("VIDEO_DEVICE_PROFILE") or _default_profile_name()
+VIDEO_WEIGHTS_VARIANT = os.getenv("VIDEO_WEIGHTS_VARIANT")  # e.g. fp16, to map weights already in the profile's dtype
+
+
+def get_device_profile(name: str = None) -> DeviceProfile:
+    name = name or VIDEO_DEVICE_PROFILE
+    if name not in DEVICE_PROFILES:
+        raise ValueError(f"Unknown device profile '{name}', expected one of {sorted(DEVICE_PROFILES)}.")
+    return DEVICE_PROFILES[name]
+
+
+_threads_configured = False
+
+
+# torch only accepts the inter-op thread count once per process, before any parallel work
+def _configure_threads(profile: DeviceProfile):
+    global _threads_configured
+    if _threads_configured:
+        return
+    if profile.intra_op_threads:
+        torch.set_num_threads(profile.intra_op_threads)
+    if profile.inter_op_threads:
+        torch.set_num_interop_threads(profile.inter_op_threads)
+    _threads_configured = True
+
+
+# Load a zeroscope pipeline and apply the settings of the device profile
+def load_diffusion_pipeline(model_id: str, profile: DeviceProfile = None, pipeline_class=DiffusionPipeline):
+    profile = profile or get_device_profile()
+    _configure_threads(profile)
+
+    shared = VIDEO_WEIGHTS_MODE in ("mmap", "preload")
+    if VIDEO_WEIGHTS_MODE == "preload" and profile.device == "cuda":
+        # CUDA can not be used again in a forked child once the parent has touched it
+        raise ValueError("VIDEO_WEIGHTS_MODE=preload only works with a CPU device profile.")
+
+    options = {}
+    if shared:
+        # Tensors stay backed by the mapped safetensors files, so the page cache holds one
+        # copy for every process. Any dtype conversion or in-place layout change copies
+        # the weights into private memory, so the variant should match the profile's dtype.
+        options.update(use_safetensors=True, low_cpu_mem_usage=True)
+        if VIDEO_WEIGHTS_VARIANT:
+            options["variant"] = VIDEO_WEIGHTS_VARIANT
+
+    pipe = pipeline_class.from_pretrained(model_id, torch_dtype=profile.dtype, **options)
+    pipe.default_scheduler = pipe.scheduler
+    pipe.device_profile = profile.name
+
+    if profile.cpu_offload:
+        # Optimize for GPU memory
+        pipe.enable_model_cpu_offload()
+    else:
+        pipe.to(profile.device)
+
+    if profile.forward_chunking:
+        pipe.unet.enable_forward_chunking(chunk_size=1, dim=1)
+    if profile.vae_slicing:
+        pipe.enable_vae_slicing()
+    if profile.attention_slicing:
+        pipe.enable_attention_slicing()
+    if profile.channels_last and not shared:
+        # Only the image VAE, the 3D UNet mixes Conv2d and Conv3d weights and torch
+        # accepts neither channels_last nor channels_last_3d for all of them
+        pipe.vae.to(memory_format=torch.channels_last)
+    if profile.compile:
+        pipe.unet = torch.compile(pipe.unet)
+    return pipe
+
+
+# Decode one video of a batch of latents a few frames at a time.
+# Yields uint8 arrays of shape (n, height, width, 3), so only one chunk of
+# full resolution frames is in memory at once.
+def decode_latent_chunks(pipe, latents, video_index: int, chunk_size: int = 4):
+    latents = latents[video_index] / pipe.vae.config.scaling_factor
+    channels, num_frames, height, width = latents.shape
+
+    with torch.no_grad():
+        for start in range(0, num_frames, chunk_size):
+            # (channels, frames, h, w) -> (frames, channels, h, w) for the image VAE
+            chunk = latents[:, start:start + chunk_size].permute(1, 0, 2, 3)
+            image = pipe.vae.decode(chunk.to(pipe.vae.dtype)).sample
+            frames = ((image / 2 + 0.5).clamp(0, 1) * 255).round()
+            yield frames.permute(0, 2, 3, 1).to(torch.uint8).cpu().numpy()
+
+
+# The zeroscope text-to-video model run through diffusers
+class DiffusersBackend(InferenceBackend):
+
+    name = "diffusers"
+
+    def __init__(self, model_id: str, profile: DeviceProfile = None):
+        super().__init__(model_id)
+        self.profile = profile or get_device_profile()
+        self.pipe = None
+
+    def load(self):
+        self.pipe = load_diffusion_pipeline(self.model_id, self.profile)
+
+    # Run the denoising loop once for all prompts, returns the video latents
+    def generate(self, prompts: list, params, callback=None, timer=None):
+        generator = None
+        if params.seed is not None:
+            generator = torch.Generator("cpu").manual_seed(params.seed)
+
+        use_scheduler(self.pipe, params.scheduler)
+        with timer.stage("text_encode") if timer is not None else nullcontext():
+            prompt_embeds, negative_prompt_embeds = encode_prompts(self.pipe, prompts)
+        return self.pipe(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_prompt_embeds,
+            num_inference_steps=params.num_inference_steps,
+            height=params.height,
+            width=params.width,
+            num_frames=params.num_frames,
+            generator=generator,
+            callback=callback,
+            callback_steps=1,
+            output_type="latent",
+        ).frames
+
+    def iter_frames(self, latents, index: int, chunk_size: int = 4):
+        return decode_latent_chunks(self.pipe, latents, index, chunk_size)
+
+    def release(self):
+        self.pipe = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def describe(self):
+        return {"backend": self.name, "device_profile": self.profile.name}
+
+
+# The zeroscope XL video-to-video model, reruns the denoising on a resized low resolution
+# video for the second, upscaling stage
+class DiffusersUpscaleBackend(DiffusersBackend):
+
+    def load(self):
+        self.pipe = load_diffusion_pipeline(self.model_id, self.profile, pipeline_class=VideoToVideoSDPipeline)
+
+    # The pipeline takes one video per call, the latents are stacked into one batch
+    def upscale(self, prompts: list, videos: list, params, callback=None):
+        generator = None
+        if params.seed is not None:
+            generator = torch.Generator("cpu").manual_seed(params.seed)
+
+        use_scheduler(self.pipe, params.scheduler)
+        latents = []
+        for prompt, video in zip(prompts, videos):
+            frames = [Image.fromarray(frame).resize((params.width, params.height)) for frame in video]
+            prompt_embeds, negative_prompt_embeds = encode_prompts(self.pipe, [prompt])
+            latents.append(self.pipe(
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                video=frames,
+                strength=params.strength,
+                num_inference_steps=params.num_inference_steps,
+                generator=generator,
+                callback=callback,
+                callback_steps=1,
+                output_type="latent",
+            ).frames)
+        return torch.cat(latents)
@@ -10,11 +10,16 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from database import engine
 import crud, models, schemas, auth
-from auth import get_db, get_current_user, get_current_active_user, retrieve_video
+from auth import get_db, get_current_user, get_current_active_user, get_optional_current_user, retrieve_video
 from security import check_user_exist, user_found, user_delete
 from user_payment import  payment_intent, webhook_received
 from auth import validate_prompt
-from user_videos import start_download_video
+from user_videos import start_download_video, start_generation_workers, stop_generation_workers, get_job_status, stream_job_progress, cancel_job, generation_stage_stats, list_quality_modes
+from user_videos import get_upscale_pool, get_video_playlist, get_video_thumbnail, VIDEO_UPSCALE_QUALITIES
+from video_pipeline import get_pipeline_pool, pipeline_stats, release_pipelines, preload_pipelines, process_memory
+from video_backends import VIDEO_WEIGHTS_MODE
+from video_timing import stage_timings
+from prompt_embeddings import prompt_embedding_cache
 # from user_payment import checkout_session, create_webhook, portal_session
 from dotenv import load_dotenv
 import os
@@ -58,6 +63,37 @@ stripe_customer_id = app.state.stripe_customer_id
 models.Base.metadata.create_all(bind=engine)
 
 
+# With gunicorn --preload this runs once in the master process, and the forked workers share the model's memory
+if VIDEO_WEIGHTS_MODE == "preload":
+    preload_pipelines()
+
+
+# Load the video model once at startup instead of on the first request
+@app.on_event("startup")
+def warm_up_video_pipeline():
+    if os.getenv("VIDEO_PIPELINE_WARM_UP", "false").lower() == "true":
+        get_pipeline_pool().warm_up()
+        if VIDEO_UPSCALE_QUALITIES:
+            get_upscale_pool().warm_up()
+
+
+# Free model memory when the server stops
+@app.on_event("shutdown")
+def release_video_pipelines():
+    release_pipelines()
+
+
+# Start the background workers that run queued video generation jobs
+@app.on_event("startup")
+def start_video_workers():
+    start_generation_workers()
+
+
+@app.on_event("shutdown")
+def stop_video_workers():
+    stop_generation_workers()
+
+
 @app.get("/")
 async def health_check():
     return JSONResponse(content={"status": "Hi Cinematic Backend is Running!"})
@@ -97,8 +133,8 @@ async def reset_password(data: schemas.ResetRequest, db: Session = Depends(get_d
 
 
 @app.post("/create-payment-intent", response_model=schemas.PaymentIntentResponse)
-async def create_payment_intent():
-    return await payment_intent()
+async def create_payment_intent(current_user = Depends(get_optional_current_user)):
+    return await payment_intent(current_user.id if current_user else None)
     
 
 @app.post("/validate-credit-card", response_model=schemas.CreditCardValidationResponse)
@@ -148,14 +184,69 @@ async def process_text_prompt(text_prompt: schemas.TextPrompt, current_user: sch
     return await validate_prompt(text_prompt, current_user.id, db)
 
 
+@app.get("/generate_video/qualities")
+async def get_quality_modes():
+    return await list_quality_modes()
+
+
+@app.get("/jobs/{job_id}")
+async def fetch_job_status(job_id: int, current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return await get_job_status(job_id, current_user.id, db)
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_generation_job(job_id: int, current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return await cancel_job(job_id, current_user.id, db)
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: int, current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return await stream_job_progress(job_id, current_user.id, db)
+
+
 @app.get("/download_video")
-async def download_video(video_url: str):
-    return await start_download_video(video_url)
+async def download_video(video_url: str, request: Request):
+    return await start_download_video(video_url, request)
+
+
+@app.get("/videos/{video_id}/hls")
+async def get_video_hls(video_id: int, current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return await get_video_playlist(video_id, current_user.id, db)
+
+
+@app.get("/videos/{video_id}/thumbnail")
+async def get_thumbnail(video_id: int, request: Request, width: int = None, current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
+    return await get_video_thumbnail(video_id, current_user.id, db, request, width)
 
 
 @app.get("/user_videos/")
 async def list_user_videos(current_user: schemas.UserResponse = Depends(get_current_active_user), db: Session = Depends(get_db)):
-   return await retrieve_video(current_user.user_id, db)
+    return await retrieve_video(current_user.id, db)
+
+
+@app.get("/pipeline/stats")
+async def get_pipeline_stats():
+    return pipeline_stats()
+
+
+@app.get("/pipeline/stages")
+async def get_pipeline_stage_stats():
+    return generation_stage_stats()
+
+
+@app.get("/pipeline/memory")
+async def get_pipeline_memory():
+    return process_memory()
+
+
+@app.get("/pipeline/timings")
+async def get_pipeline_timings():
+    return stage_timings.summary()
+
+
+@app.get("/pipeline/prompt_cache")
+async def get_prompt_cache_stats():
+    return prompt_embedding_cache.stats()
 
 
 @app.post("/logout/")
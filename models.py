@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, func, ForeignKey
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Integer, String, Text, func, ForeignKey
 from sqlalchemy.orm import mapped_column, relationship
 from database import Base
 from sqlalchemy.sql import func
@@ -14,6 +14,7 @@ class User(Base):
     hashed_password = Column(String(255))
     is_active = Column(Boolean, default=False)
     verified_at = Column(DateTime, nullable=True, default=None)
+    paid_at = Column(DateTime, nullable=True, default=None)  # set by the Stripe webhook, paid accounts get generation priority
     updated_at = Column(DateTime, nullable=True, default=None, onupdate=datetime.now)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     
@@ -56,6 +57,60 @@ class Video(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id')) # Adjust 'user.id' based on your User model's table name
     video_path = Column(String(255))  # Specify a length, e.g., 255 characters
+    hls_path = Column(String(255), nullable=True)  # HLS playlist, set once the video has been segmented
+    poster_path = Column(String(255), nullable=True)
+    thumbnail_path = Column(String(255), nullable=True)
+    prompt = Column(Text, nullable=True)
+    byte_size = Column(BigInteger, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    fps = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
-    user = relationship("User")  # Adjust "User" based on your User model's class name
\ No newline at end of file
+    user = relationship("User")  # Adjust "User" based on your User model's class name
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    prompt = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, done, failed
+    cache_key = Column(String(64), nullable=True, index=True)
+    quality = Column(String(20), nullable=False, default="standard")  # draft, standard, high
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=True)
+    video_path = Column(String(255), nullable=True)
+    error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    upscale_status = Column(String(20), nullable=True, index=True)  # queued, running, done, failed, None when not upscaled
+    upscaled_video_path = Column(String(255), nullable=True)
+    timings = Column(Text, nullable=True)  # JSON seconds per stage and denoising step histogram
+    worker_id = Column(String(100), nullable=True, index=True)  # process that holds the job's queued or running stage
+    claim_token = Column(String(32), nullable=True)  # written by each claim, so a claim reads back only its own rows
+    inflight_key = Column(String(64), nullable=True, unique=True, index=True)  # cache_key while the job's run is in flight, one run per key
+    leader_job_id = Column(Integer, ForeignKey('generation_jobs.id'), nullable=True, index=True)  # set on followers, the job whose run they wait on
+
+    user = relationship("User")
+    video = relationship("Video")
+
+
+# A process running generation workers, jobs of workers that stop beating are failed or taken over
+class GenerationWorker(Base):
+    __tablename__ = "generation_workers"
+    id = Column(String(100), primary_key=True)  # hostname:pid:random
+    started_at = Column(DateTime, default=datetime.now)
+    heartbeat_at = Column(DateTime, default=datetime.now, index=True)
+
+
+class VideoCacheEntry(Base):
+    __tablename__ = "video_cache_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)  # sha256 of prompt and parameters
+    video_path = Column(String(255), nullable=False)
+    byte_size = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+    last_accessed_at = Column(DateTime, default=datetime.now, index=True)
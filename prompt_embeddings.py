@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from video_cache import normalize_prompt
+
+load_dotenv()
+
+
+# Configuration
+PROMPT_EMBED_CACHE_SIZE = int(os.getenv("PROMPT_EMBED_CACHE_SIZE", 512))
+PROMPT_EMBED_SPILL_DIR = os.getenv("PROMPT_EMBED_SPILL_DIR")  # unset keeps the cache in memory only
+
+
+# Bounded LRU of text encoder outputs keyed by model and normalized prompt.
+# Entries pushed out of memory are written to spill_dir, if set, and read back on a later miss.
+class PromptEmbeddingCache:
+
+    def __init__(self, max_entries: int = PROMPT_EMBED_CACHE_SIZE, spill_dir: str = PROMPT_EMBED_SPILL_DIR):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model_id: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_id}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.pt")
+
+    def get(self, key: str):
+        with self._lock:
+            embeds = self._entries.get(key)
+            if embeds is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embeds
+
+        if self.spill_dir and os.path.exists(self._spill_path(key)):
+            import torch
+            try:
+                embeds = torch.load(self._spill_path(key), map_location="cpu")
+            except Exception as load_exec:
+                logging.warning(f"Could not read spilled prompt embedding {key}: {load_exec}")
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                self.put(key, embeds)
+                return embeds
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embeds):
+        evicted = []
+        with self._lock:
+            self._entries[key] = embeds
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+
+        if self.spill_dir and evicted:
+            import torch
+            for evicted_key, evicted_embeds in evicted:
+                if not os.path.exists(self._spill_path(evicted_key)):
+                    torch.save(evicted_embeds, self._spill_path(evicted_key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "spill_dir": self.spill_dir,
+            }
+
+
+prompt_embedding_cache = PromptEmbeddingCache()
+
+
+# Text encoder output for each prompt, running the encoder only on cache misses.
+# Returns (prompt_embeds, negative_prompt_embeds) batched in prompt order on the pipeline's device.
+def encode_prompts(pipe, prompts: list, cache: PromptEmbeddingCache = prompt_embedding_cache):
+    import torch
+
+    model_id = getattr(pipe, "name_or_path", "")
+    device = pipe._execution_device
+    positives, negatives = [], []
+
+    with torch.no_grad():
+        for prompt in prompts:
+            key = cache.key(model_id, prompt)
+            embeds = cache.get(key)
+            if embeds is None:
+                prompt_embeds, negative_prompt_embeds = pipe.encode_prompt(
+                    prompt, device, num_images_per_prompt=1, do_classifier_free_guidance=True
+                )
+                embeds = (prompt_embeds.cpu(), negative_prompt_embeds.cpu())
+                cache.put(key, embeds)
+            positives.append(embeds[0])
+            negatives.append(embeds[1])
+
+    return torch.cat(positives).to(device), torch.cat(negatives).to(device)
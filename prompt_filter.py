@@ -0,0 +1,133 @@
+import logging
+import os
+import re
+import unicodedata
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+PROMPT_BLOCKLIST_PATH = os.getenv("PROMPT_BLOCKLIST_PATH", "prompt_blocklist.txt")
+PROMPT_MIN_LENGTH = int(os.getenv("PROMPT_MIN_LENGTH", 3))
+PROMPT_MAX_LENGTH = int(os.getenv("PROMPT_MAX_LENGTH", 500))
+PROMPT_MAX_SYMBOL_RATIO = float(os.getenv("PROMPT_MAX_SYMBOL_RATIO", 0.3))  # share of characters that are not letters, digits or spaces
+PROMPT_MAX_REPEAT = int(os.getenv("PROMPT_MAX_REPEAT", 8))  # longest run of one repeated character
+
+
+def _normalize(text: str):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+# Aho-Corasick automaton over all blocklist terms, finds every match in one pass over
+# the text no matter how many terms there are. A term matches whole words only, unless
+# it ends with * in which case any word starting with it matches.
+class KeywordMatcher:
+
+    def __init__(self, terms: list):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # state -> (term length, prefix only) of the terms ending there
+        for term in terms:
+            prefix = term.endswith("*")
+            term = _normalize(term.rstrip("*"))
+            if term:
+                self._add(term, prefix)
+        self._build()
+        self.size = sum(len(output) for output in self._output)
+
+    def _add(self, term: str, prefix: bool):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(term), prefix))
+
+    # Breadth first, every state's failure link points to its longest proper suffix in the trie
+    def _build(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                if state:
+                    fail = self._fail[state]
+                    while fail and char not in self._goto[fail]:
+                        fail = self._fail[fail]
+                    self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    # First blocklisted term in the text, or None
+    def find(self, text: str):
+        text = _normalize(text)
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, prefix in self._output[state]:
+                start = end - length
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if not prefix and end < len(text) and text[end].isalnum():
+                    continue
+                return text[start:end]
+        return None
+
+
+# Terms from a blocklist file, one per line, blank lines and # comments are skipped
+def load_blocklist(path: str):
+    if not os.path.exists(path):
+        logging.warning(f"Prompt blocklist {path} not found, only length and character checks apply.")
+        return []
+    with open(path, encoding="utf-8") as blocklist:
+        return [line.strip() for line in blocklist if line.strip() and not line.lstrip().startswith("#")]
+
+
+# Cheap checks run on every prompt before it can take a place in the generation queue
+class PromptFilter:
+
+    def __init__(self, terms: list):
+        self.matcher = KeywordMatcher(terms)
+
+    # Reason the prompt is rejected, or None if it may be generated
+    def check(self, text: str):
+        length = len(text.strip())
+        if length < PROMPT_MIN_LENGTH:
+            return f"Text prompt must be at least {PROMPT_MIN_LENGTH} characters."
+        if length > PROMPT_MAX_LENGTH:
+            return f"Text prompt must be at most {PROMPT_MAX_LENGTH} characters."
+
+        letters = symbols = 0
+        run, previous = 0, None
+        for char in text:
+            category = unicodedata.category(char)
+            if category[0] == "C" and char not in "\t\n\r":
+                return "Text prompt contains control characters."
+            if category[0] == "L":
+                letters += 1
+            elif category[0] in ("P", "S"):
+                # Combining marks (M) are parts of words, e.g. vowel signs in Indic scripts
+                symbols += 1
+            run = run + 1 if char == previous else 1
+            previous = char
+            if run > PROMPT_MAX_REPEAT and not char.isspace():
+                return "Text prompt repeats the same character too often."
+        if not letters:
+            return "Text prompt must contain words."
+        if symbols / len(text) > PROMPT_MAX_SYMBOL_RATIO:
+            return "Text prompt contains too many symbols."
+
+        if self.matcher.find(text) is not None:
+            return "Text prompt contains disallowed content."
+        return None
+
+
+prompt_filter = PromptFilter(load_blocklist(PROMPT_BLOCKLIST_PATH))
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 from typing import Union
 from datetime import datetime
 from pydantic import EmailStr, BaseModel
@@ -43,6 +43,7 @@ class TokenData(BaseModel):
 
 class TextPrompt(BaseModel):
     text: str
+    quality: Literal["draft", "standard", "high"] = "standard"
 
 
 class UserResponse(BaseResponse):
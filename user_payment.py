@@ -1,7 +1,10 @@
 from fastapi import HTTPException, Request
 import json
+import logging
 import os
 import stripe
+from database import SessionLocal
+import crud
 
 
 
@@ -10,8 +13,8 @@ stripe.api_key = os.environ["STRIPE_SECRET_KEY"]
 webhook_secret = os.environ["STRIPE_WEBHOOK_SECRET"]
 
 
-# starting payment intent
-async def payment_intent():
+# starting payment intent, the user id is kept on the intent so the webhook can upgrade the account
+async def payment_intent(user_id: int = None):
 
     try:
         # Set the amount and currency directly, bypassing the need to extract from request
@@ -27,7 +30,7 @@ async def payment_intent():
             raise ValueError("Unsupported currency.")
 
         # Call the function to create a Payment Intent
-        payment_intent = await create_payment_intent_backend(amount, currency)
+        payment_intent = await create_payment_intent_backend(amount, currency, user_id)
         return payment_intent
     
     except ValueError as e:
@@ -38,7 +41,7 @@ async def payment_intent():
 
 
 # Function to create a Payment Intent with specific payment methods
-async def create_payment_intent_backend(amount: int, currency: str):
+async def create_payment_intent_backend(amount: int, currency: str, user_id: int = None):
 
     try:
         # Define the payment methods you want to accept
@@ -49,6 +52,7 @@ async def create_payment_intent_backend(amount: int, currency: str):
             amount=amount,  # Amount is in cents
             currency=currency,
             payment_method_types=payment_method_types,
+            metadata={"user_id": str(user_id)} if user_id else {},
             # Add any other parameters you need here, e.g., customer
         )
         # Return the client secret and any other information your frontend may need
@@ -96,6 +100,7 @@ async def webhook_received(request: Request):
         payment_intent = event['data']['object']
         print('💰 [%s] PaymentIntent(%s): (%s)' % (event.id, payment_intent.id, payment_intent.status ))
         # Fulfill any orders, e-mail receipts, etc
+        mark_paid_user(payment_intent)
         # To cancel the payment you will need to issue a Refund (https://stripe.com/docs/api/refunds)
 
         
@@ -122,6 +127,20 @@ async def webhook_received(request: Request):
     return {"status": "success"}
 
 
+# Paid accounts get a larger share of the video generation workers
+def mark_paid_user(payment_intent):
+    user_id = (payment_intent.get("metadata") or {}).get("user_id")
+    if not user_id:
+        return
+    db = SessionLocal()
+    try:
+        crud.mark_user_paid(db, int(user_id))
+    except Exception as paid_exec:
+        logging.exception(paid_exec)
+    finally:
+        db.close()
+
+
 
 
 # # checkout function -payment  powered by stripe
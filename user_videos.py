@@ -1,65 +1,984 @@
-import torch
-from diffusers import DiffusionPipeline, DPMSolverMultistepScheduler
-from diffusers.utils import export_to_video
-from PIL import Image
-from fastapi import HTTPException, Response
+import asyncio
+import functools
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from database import SessionLocal
 from models import Video
+from video_jobs import JobQueue, ProgressTracker, StagePool, JobCancelled
+from video_jobs import JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED, JOB_FINISHED_STATUSES
+from video_backends import load_upscale_backend
+from video_download import file_download_response
+from video_encoder import StreamingVideoWriter, read_video_frames, VIDEO_FPS
+from video_hls import hls_available, segment_video, link_segments
+from video_previews import preview_paths, write_previews, read_poster_frame, thumbnail_variant, link_previews, VIDEO_THUMBNAIL_SIZES
+from video_pipeline import get_pipeline_pool
+from video_timing import StageTimer, stage_timings
+from admission import AdmissionController
+import crud
 import os
+import video_cache
+import video_storage
 
 
 
-output_folder_path = 'static/output_video'
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", 1))
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", 1))
+VIDEO_BATCH_WAIT_MS = int(os.getenv("VIDEO_BATCH_WAIT_MS", 0))
+VIDEO_ENCODE_WORKERS = int(os.getenv("VIDEO_ENCODE_WORKERS", 2))
+VIDEO_ENCODE_MAX_PENDING = int(os.getenv("VIDEO_ENCODE_MAX_PENDING", 8))
+VIDEO_PAID_WEIGHT = float(os.getenv("VIDEO_PAID_WEIGHT", 4))
+VIDEO_MAX_RUNNING_PER_USER = int(os.getenv("VIDEO_MAX_RUNNING_PER_USER", 1))
+VIDEO_MAX_RUNNING_PER_PAID_USER = int(os.getenv("VIDEO_MAX_RUNNING_PER_PAID_USER", 2))
+VIDEO_DECODE_CHUNK_FRAMES = int(os.getenv("VIDEO_DECODE_CHUNK_FRAMES", 4))
+VIDEO_UPSCALE_MODEL_ID = os.getenv("VIDEO_UPSCALE_MODEL_ID", "cerspense/zeroscope_v2_XL")
+VIDEO_UPSCALE_QUALITIES = [quality.strip() for quality in os.getenv("VIDEO_UPSCALE_QUALITIES", "high").split(",") if quality.strip()]
+VIDEO_UPSCALE_WORKERS = int(os.getenv("VIDEO_UPSCALE_WORKERS", 1))
+VIDEO_UPSCALE_REPLICAS = int(os.getenv("VIDEO_UPSCALE_REPLICAS", 1))
+VIDEO_HLS = os.getenv("VIDEO_HLS", "true").lower() == "true"
+VIDEO_HLS_WORKERS = int(os.getenv("VIDEO_HLS_WORKERS", 1))
+VIDEO_HLS_MAX_PENDING = int(os.getenv("VIDEO_HLS_MAX_PENDING", 64))
+VIDEO_WORKER_HEARTBEAT_SECONDS = int(os.getenv("VIDEO_WORKER_HEARTBEAT_SECONDS", 30))
+VIDEO_WORKER_TIMEOUT_SECONDS = int(os.getenv("VIDEO_WORKER_TIMEOUT_SECONDS", 120))  # a worker silent this long is taken as dead
+VIDEO_CANCEL_POLL_SECONDS = float(os.getenv("VIDEO_CANCEL_POLL_SECONDS", 2))  # how often running batches look for cancellations
+PROGRESS_POLL_SECONDS = 0.5
 
-# Generate videos 
-async def create_video(text_prompt: str, user_id: int, db):
 
-    global video_frames
-    prompt = text_prompt
+# Everything that changes the generated video, also used as the cache key
+@dataclass(frozen=True)
+class GenerationParams:
+    num_inference_steps: int = 40
+    height: int = 320
+    width: int = 576
+    num_frames: int = 3 * 8  # 3 seconds at 8 fps
+    scheduler: str = "default"
+    seed: int = None
 
-    # Customize the output name
-    vid_name_1 = 'before_upscale'
 
-    # Create pipeline
-    pipe = DiffusionPipeline.from_pretrained("cerspense/zeroscope_v2_576w", torch_dtype=torch.float16)
+DEFAULT_GENERATION_PARAMS = GenerationParams()
 
-     # Optimize for GPU memory
-    # if torch.cuda.is_available():
-    pipe.enable_model_cpu_offload()
-        
-    # Create video
-    pipe.unet.enable_forward_chunking(chunk_size=1, dim=1)
-    pipe.enable_vae_slicing()
+# Quality modes offered to users. Draft is for checking a prompt within seconds
+# before paying for a full render.
+QUALITY_PRESETS = {
+    "draft": GenerationParams(num_inference_steps=12, height=192, width=320, num_frames=2 * 8, scheduler="dpm++"),
+    "standard": DEFAULT_GENERATION_PARAMS,
+    "high": GenerationParams(num_inference_steps=50, height=320, width=576, num_frames=3 * 8, scheduler="dpm++-karras"),
+}
+DEFAULT_QUALITY = "standard"
 
-    video_duration_seconds = 3
-    num_frames = video_duration_seconds * 8
-    # Set output path
-    output_name = f'{output_folder_path}/{vid_name_1}.mp4'  
-    video_frames = pipe(prompt, num_inference_steps=40, height=320, width=576, num_frames=num_frames).frames
-    video_frames = video_frames.reshape(-1, 320, 576, 3)
-    video_path = export_to_video(video_frames, output_video_path=output_name)
 
-    # Save video metadata to the database
-    # db = next(get_db())  # Get the DB session; adjust according to how you manage database sessions
-    db = db
-    new_video = Video(user_id=user_id, video_path=video_path)
+# Second stage for the qualities in VIDEO_UPSCALE_QUALITIES: the finished low resolution
+# video is resized and partly re-noised, then denoised again by the XL model
+@dataclass(frozen=True)
+class UpscaleParams:
+    num_inference_steps: int = 40
+    height: int = 576
+    width: int = 1024
+    strength: float = 0.6
+    scheduler: str = "default"
+    seed: int = None
+
+
+UPSCALE_PARAMS = UpscaleParams()
+
+
+# Stream one video of a generated batch into its mp4 a chunk of frames at a time,
+# so the full frame tensor is never held in memory. With an executor the encoding
+# runs there and on_finished(path) is called once the file is complete.
+# Decode and export times are added to timer when one is given. With previews the middle
+# frame is kept as it passes and written as the poster and thumbnail next to the mp4.
+def encode_video(backend, result, index: int, output_name: str, params: GenerationParams = DEFAULT_GENERATION_PARAMS, executor=None, on_finished=None, timer: StageTimer = None, previews: bool = True):
+
+    poster_index = params.num_frames // 2 if previews else None
+    poster_frame = None
+
+    def save_previews(path):
+        if path is not None and poster_frame is not None:
+            try:
+                write_previews(poster_frame, path)
+            except Exception as preview_exec:
+                # The video is fine without previews, they are made again on demand
+                logging.exception(preview_exec)
+
+    def finished(path):
+        if timer is not None:
+            timer.add("export", writer.encode_seconds)
+        save_previews(path)
+        on_finished(path)
+
+    with StreamingVideoWriter(output_name, params.width, params.height, executor=executor, on_finished=finished if on_finished else None) as writer:
+        chunks = backend.iter_frames(result, index, VIDEO_DECODE_CHUNK_FRAMES)
+        decode_seconds = 0.0
+        frames_seen = 0
+        while True:
+            started = time.perf_counter()
+            frames = next(chunks, None)
+            decode_seconds += time.perf_counter() - started
+            if frames is None:
+                break
+            if poster_index is not None and frames_seen <= poster_index < frames_seen + len(frames):
+                poster_frame = frames[poster_index - frames_seen].copy()
+            frames_seen += len(frames)
+            writer.write(frames)
+        # Recorded before the writer finishes, since on_finished may persist the timer
+        if timer is not None:
+            timer.add("decode", decode_seconds)
+    if on_finished is None:
+        if timer is not None:
+            timer.add("export", writer.encode_seconds)
+        save_previews(output_name)
+    return output_name
+
+
+# Generate and write one mp4 per prompt, returns the written paths in prompt order
+def render_videos(prompts: list, output_names: list, params: GenerationParams = DEFAULT_GENERATION_PARAMS, callback=None):
+
+    # Reuse a warm model from the process-wide pool
+    with get_pipeline_pool().acquire() as backend:
+        result = backend.generate(prompts, params, callback)
+        return [
+            encode_video(backend, result, index, output_name, params)
+            for index, output_name in enumerate(output_names)
+        ]
+
+
+# Record a finished video for the job's user and mark the job as done. Returns False, and
+# records nothing, when the job left from_status meanwhile, for example by a cancellation.
+def _complete_job(db, job, video_path: str, from_status: str = JOB_RUNNING):
+    params = QUALITY_PRESETS.get(job.quality, DEFAULT_GENERATION_PARAMS)
+    new_video = Video(
+        user_id=job.user_id,
+        video_path=video_path,
+        prompt=job.prompt,
+        **video_storage.video_metadata(video_path, params.width, params.height, VIDEO_FPS, params.num_frames),
+    )
+    poster_path, thumbnail_path = preview_paths(video_path)
+    if os.path.exists(poster_path) and os.path.exists(thumbnail_path):
+        new_video.poster_path, new_video.thumbnail_path = poster_path, thumbnail_path
     db.add(new_video)
+    db.flush()
+
+    completed = crud.transition_generation_job(
+        db,
+        job.id,
+        from_status,
+        status=JOB_DONE,
+        video_id=new_video.id,
+        video_path=video_path,
+        started_at=job.started_at or datetime.now(),
+        finished_at=datetime.now(),
+        inflight_key=None,
+    )
+    if completed:
+        job_progress.finished(job.id)
+    return completed
+
+
+# Add a generated video to the cache under the job's key
+def _cache_video(db, key: str, video_path: str):
+    if not key:
+        return
+    try:
+        video_cache.store(db, key, video_path)
+    except Exception as cache_exec:
+        # A cache failure must not fail a finished video
+        logging.exception(cache_exec)
+        db.rollback()
+
+
+# Delete a video file and its previews
+def _remove_video_files(video_path: str):
+    for path in (video_path, *preview_paths(video_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Copy a finished file to the storage backend downloads are served from, False if that failed
+def _publish(path: str) -> bool:
+    try:
+        video_storage.get_storage_backend().publish(path)
+        return True
+    except Exception as publish_exec:
+        logging.exception(publish_exec)
+        return False
+
+
+# Run a queued job, or attach it to the run already in flight for the same prompt and
+# parameters. The job table decides, so this holds across worker processes: the unique
+# inflight_key lets one job per key lead, and the leader row stays locked while a follower
+# attaches, so it can not finish without seeing the follower.
+def _lead_or_follow(db, job, replaces: int = None):
+    key = job.cache_key
+    for _ in range(3):
+        leader = crud.get_inflight_job(db, key, lock=True)
+        if leader is not None and leader.id == job.id:
+            db.commit()
+            return
+        if leader is not None:
+            if crud.follow_generation_job(db, job.id, leader.id):
+                job_progress.follow(job.id, leader.id)
+            return
+        db.commit()
+        if crud.lead_generation_job(db, job.id, key, worker_id):
+            _submit_job(db, job.id, job.user_id, job.quality, replaces=replaces)
+            return
+    # Keeps losing to runs that end at the same moment, run it on its own
+    _submit_job(db, job.id, job.user_id, job.quality, replaces=replaces)
+
+
+# End the run of the given job and finish the jobs that were waiting on it,
+# returns the ids of the followers that got the video. When the run was cancelled
+# before it made a video, the followers start a new run instead.
+def _resolve_followers(db, job, video_path: str, error: str, replaces: int = None):
+    crud.release_inflight_job(db, job.id)
+    followers = crud.get_generation_job_followers(db, job.id)
+
+    if video_path is None and error is None:
+        for follower in followers:
+            _lead_or_follow(db, follower, replaces=replaces)
+        return []
+
+    completed = []
+    for follower in followers:
+        if video_path is not None:
+            # Each user gets their own link to the leader's file
+            follower_path = video_cache.link_or_copy(video_path, video_storage.new_path())
+            link_previews(video_path, follower_path)
+            if not _publish(follower_path):
+                crud.transition_generation_job(db, follower.id, JOB_QUEUED, status=JOB_FAILED, error="Could not store the video.", finished_at=datetime.now())
+            elif _complete_job(db, follower, follower_path, from_status=JOB_QUEUED):
+                completed.append(follower.id)
+            else:
+                # Cancelled meanwhile
+                _remove_video_files(follower_path)
+        else:
+            crud.transition_generation_job(db, follower.id, JOB_QUEUED, status=JOB_FAILED, error=error, finished_at=datetime.now())
+        job_progress.finished(follower.id)
+    return completed
+
+
+# Jobs of a batch nobody waits for any more: cancelled, from any process, and without followers
+def _abandoned_jobs(job_ids: list):
+    db = SessionLocal()
+    try:
+        return crud.get_abandoned_generation_job_ids(db, job_ids)
+    finally:
+        db.close()
+
+
+# Persist the outcome of one job, runs on the encode stage once its mp4 is complete
+# or on the generation worker when no video was produced
+def _finish_job(job_id: int, video_path: str = None, error: str = None, timer: StageTimer = None):
+
+    persist_started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        job = crud.get_generation_job(db, job_id)
+
+        # Only a job that is still running is finished here. The status is checked again
+        # when it is written, a cancellation from another process may land in between.
+        finished = False
+        if job.status == JOB_RUNNING:
+            if video_path is not None and not _publish(video_path):
+                video_path, error = None, "Could not store the video."
+            if video_path is not None:
+                finished = _complete_job(db, job, video_path)
+            else:
+                error = error or "Video generation did not produce a file."
+                finished = crud.transition_generation_job(
+                    db,
+                    job_id,
+                    JOB_RUNNING,
+                    status=JOB_FAILED,
+                    error=error,
+                    finished_at=datetime.now(),
+                    inflight_key=None,
+                )
+
+        if not finished:
+            # Cancelled, or given up on by another process. The job only kept rendering
+            # for its followers, its own copy is dropped afterwards. The video is still
+            # good, so the cache keeps a link to it for the next identical request.
+            if video_path is not None:
+                _cache_video(db, job.cache_key, video_path)
+            follower_ids = _resolve_followers(db, job, video_path, error)
+            if video_path is not None:
+                _remove_video_files(video_path)
+            job_progress.finished(job_id)
+            if follower_ids:
+                followers = [crud.get_generation_job(db, follower_id) for follower_id in follower_ids]
+                _queue_hls([(follower.video_id, follower.video_path) for follower in followers])
+                _queue_upscale(db, followers[0], follower_ids[1:])
+            return
+        job_progress.finished(job_id)
+
+        if timer is not None:
+            timer.end("persist", persist_started)
+            timings = timer.to_dict()
+            job.timings = json.dumps(timings)
+            db.commit()
+            if video_path is not None:
+                stage_timings.record(job.quality, timings)
+
+        if video_path is not None:
+            _cache_video(db, job.cache_key, video_path)
+        follower_ids = _resolve_followers(db, job, video_path, error)
+        if video_path is not None:
+            finished_jobs = [job] + [crud.get_generation_job(db, follower_id) for follower_id in follower_ids]
+            _queue_hls([(finished.video_id, finished.video_path) for finished in finished_jobs])
+            _queue_upscale(db, job, follower_ids)
+    except Exception as persist_exec:
+        logging.exception(persist_exec)
+    finally:
+        db.close()
+
+
+# Videos waiting for or being segmented, so each is only queued once
+_hls_pending = set()
+_hls_pending_lock = threading.Lock()
+
+
+# Queue HLS segmenting of finished videos, given as (video_id, video_path) pairs that
+# all hold the same file. The first is segmented and the others get links to its segments.
+def _queue_hls(videos: list):
+    if not VIDEO_HLS or not hls_available():
+        return
+    with _hls_pending_lock:
+        videos = [video for video in videos if video[0] is not None and video[0] not in _hls_pending]
+        _hls_pending.update(video_id for video_id, _ in videos)
+    if videos:
+        hls_stage.submit(_segment_videos, videos)
+
+
+# Runs on the HLS stage, one directory of segments next to each video
+def _segment_videos(videos: list):
+    playlists = {}
+    try:
+        source_id, source_path = videos[0]
+        source_dir = video_storage.sibling_path(source_path, "_hls")
+        playlists[source_id] = segment_video(source_path, source_dir, VIDEO_FPS)
+        for video_id, video_path in videos[1:]:
+            playlists[video_id] = link_segments(source_dir, video_storage.sibling_path(video_path, "_hls"))
+
+        db = SessionLocal()
+        try:
+            for video in db.query(Video).filter(Video.id.in_(list(playlists))).all():
+                video.hls_path = playlists[video.id]
+            db.commit()
+        finally:
+            db.close()
+    except Exception as hls_exec:
+        logging.exception(hls_exec)
+    finally:
+        with _hls_pending_lock:
+            _hls_pending.difference_update(video_id for video_id, _ in videos)
+
+
+# Generate the videos for a batch of queued jobs, runs on a generation worker thread.
+# Jobs are grouped by quality since one pipeline call needs a single set of parameters.
+def run_generation_jobs(job_ids: list):
+
+    db = SessionLocal()
+    try:
+        jobs = crud.claim_generation_jobs(db, job_ids, worker_id)
+        groups = {}
+        queue_waits = {}
+        for job in jobs:
+            groups.setdefault(job.quality or DEFAULT_QUALITY, []).append((job.id, job.prompt))
+            queue_waits[job.id] = (job.started_at - job.created_at).total_seconds()
+    finally:
+        db.close()
+
+    for quality, group in groups.items():
+        running_ids = [job_id for job_id, _ in group]
+        prompts = [prompt for _, prompt in group]
+        started = time.perf_counter()
+        _run_batch(running_ids, prompts, QUALITY_PRESETS.get(quality, DEFAULT_GENERATION_PARAMS), queue_waits)
+        quality_latency.record(quality, time.perf_counter() - started)
+
+
+# Denoise and decode one batch of jobs that share their parameters.
+# The worker only denoises and decodes, encoding and persistence continue on the
+# encode stage so the model replica is free for the next batch.
+def _run_batch(running_ids: list, prompts: list, params: GenerationParams, queue_waits: dict = None):
+
+    job_progress.started(running_ids, params.num_inference_steps)
+    # Shared by the whole batch until decoding, then forked per job
+    timer = StageTimer()
+    last_poll = time.monotonic()
+
+    def report_step(step, timestep, latents):
+        nonlocal last_poll
+        timer.step()
+        job_progress.step(running_ids, step + 1)
+        # Cancellations can come from any process, so the job table is read every few seconds.
+        # Stop at the next step once nobody waits for any job of the batch.
+        if time.monotonic() - last_poll >= VIDEO_CANCEL_POLL_SECONDS:
+            last_poll = time.monotonic()
+            if len(_abandoned_jobs(running_ids)) == len(running_ids):
+                raise JobCancelled()
+
+    handed_off = set()
+    error = None
+    try:
+        # Reuse a warm model from the process-wide pool
+        acquire_started = time.perf_counter()
+        with get_pipeline_pool().acquire() as backend:
+            timer.end("acquire", acquire_started)
+            result = backend.generate(prompts, params, callback=report_step, timer=timer)
+
+            abandoned = _abandoned_jobs(running_ids)
+            for index, job_id in enumerate(running_ids):
+                if job_id in abandoned:
+                    continue
+                job_timer = timer.fork()
+                if queue_waits and job_id in queue_waits:
+                    job_timer.add("queue_wait", queue_waits[job_id])
+                # One file per job so concurrent jobs never overwrite each other
+                output_name = video_storage.new_path()
+                encode_video(
+                    backend,
+                    result,
+                    index,
+                    output_name,
+                    params,
+                    executor=encode_stage,
+                    on_finished=functools.partial(_finish_job, job_id, timer=job_timer),
+                    timer=job_timer,
+                )
+                handed_off.add(job_id)
+    except JobCancelled:
+        logging.info(f"Cancelled generation of jobs {running_ids}")
+    except Exception as render_exec:
+        logging.exception(render_exec)
+        error = str(render_exec)[:255]
+
+    # Jobs that never reached the encoder are finished here
+    for job_id in running_ids:
+        if job_id not in handed_off:
+            _finish_job(job_id, None, error)
+
+
+def _upscale_cache_key(prompt: str, quality: str):
+    params = QUALITY_PRESETS.get(quality, DEFAULT_GENERATION_PARAMS)
+    return video_cache.cache_key(prompt, {**asdict(params), "upscale": asdict(UPSCALE_PARAMS)})
+
+
+def get_upscale_pool():
+    return get_pipeline_pool(VIDEO_UPSCALE_MODEL_ID, VIDEO_UPSCALE_REPLICAS, loader=load_upscale_backend)
+
+
+# Queue the upscale of a finished job if its quality has one. waiter_ids are
+# followers that share the job's video and get a link to the upscaled one too.
+def _queue_upscale(db, job, waiter_ids: list = ()):
+    if job is None or job.quality not in VIDEO_UPSCALE_QUALITIES:
+        return
+
+    key = _upscale_cache_key(job.prompt, job.quality)
+    cached = video_cache.lookup(db, key)
+    waiters = [crud.get_generation_job(db, waiter_id) for waiter_id in waiter_ids]
+    # The waiters follow the job in the job table, so whichever process finishes the
+    # upscale finds them there. The job itself leads, its upscale can move between processes.
+    job.leader_job_id = None
+    for waiter in waiters:
+        waiter.leader_job_id = job.id
+    for queued_job in [job] + waiters:
+        if cached is not None:
+            upscaled_path = video_cache.copy_to(cached, video_storage.new_path())
+            if _publish(upscaled_path):
+                queued_job.upscaled_video_path = upscaled_path
+                queued_job.upscale_status = JOB_DONE
+            else:
+                queued_job.upscale_status = JOB_FAILED
+        else:
+            queued_job.upscale_status = JOB_QUEUED
     db.commit()
-    db.refresh(new_video)
 
-    return video_path
+    if cached is None:
+        upscale_queue.submit(job.id, job.user_id)
+
+
+# Persist the outcome of one upscale, runs on the encode stage once its mp4 is complete
+# or on the upscale worker when no video was produced
+def _finish_upscale(job_id: int, video_path: str = None, error: str = None):
+
+    db = SessionLocal()
+    try:
+        job = crud.get_generation_job(db, job_id)
+        if video_path is None:
+            logging.warning(f"Upscale of job {job_id} failed: {error}")
+
+        for finished_job in [job] + crud.get_upscale_waiters(db, job_id):
+            if finished_job is None:
+                continue
+            upscaled_path = video_path
+            if upscaled_path is not None and finished_job.id != job_id:
+                upscaled_path = video_cache.link_or_copy(video_path, video_storage.new_path())
+            if upscaled_path is None or not _publish(upscaled_path):
+                finished_job.upscale_status = JOB_FAILED
+            else:
+                finished_job.upscaled_video_path = upscaled_path
+                finished_job.upscale_status = JOB_DONE
+        db.commit()
+
+        if video_path is not None:
+            try:
+                video_cache.store(db, _upscale_cache_key(job.prompt, job.quality), video_path)
+            except Exception as cache_exec:
+                logging.exception(cache_exec)
+                db.rollback()
+    except Exception as persist_exec:
+        logging.exception(persist_exec)
+    finally:
+        db.close()
+
+
+# Upscale finished low resolution videos, runs on an upscale worker thread with its
+# own model pool, so it overlaps with base generation of the next jobs
+def run_upscale_jobs(job_ids: list):
+
+    for job_id in job_ids:
+        db = SessionLocal()
+        try:
+            job = crud.claim_upscale_job(db, job_id, worker_id)
+            if job is None:
+                continue
+            prompt, source_path = job.prompt, job.video_path
+        finally:
+            db.close()
+
+        handed_off = False
+        error = None
+        try:
+            frames = read_video_frames(source_path)
+            with get_upscale_pool().acquire() as backend:
+                result = backend.upscale([prompt], [frames], UPSCALE_PARAMS)
+                encode_video(
+                    backend,
+                    result,
+                    0,
+                    video_storage.new_path(),
+                    UPSCALE_PARAMS,
+                    executor=encode_stage,
+                    on_finished=functools.partial(_finish_upscale, job_id),
+                    previews=False,
+                )
+                handed_off = True
+        except Exception as upscale_exec:
+            logging.exception(upscale_exec)
+            error = str(upscale_exec)[:255]
+
+        if not handed_off:
+            _finish_upscale(job_id, None, error)
+
+
+# Running average of generation time per quality, shown to users choosing a mode
+class QualityLatency:
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._seconds = {}
+
+    def record(self, quality: str, seconds: float):
+        with self._lock:
+            previous = self._seconds.get(quality)
+            if previous is None:
+                self._seconds[quality] = seconds
+            else:
+                self._seconds[quality] = previous + self.smoothing * (seconds - previous)
+
+    def get(self, quality: str):
+        with self._lock:
+            return self._seconds.get(quality)
+
+    # Mean over the qualities seen so far, None before the first job
+    def average(self):
+        with self._lock:
+            if not self._seconds:
+                return None
+            return sum(self._seconds.values()) / len(self._seconds)
 
 
+quality_latency = QualityLatency()
+
+
+# Available quality modes with their settings and the generation time observed so far
+async def list_quality_modes():
+    return [
+        {
+            "quality": quality,
+            "num_inference_steps": params.num_inference_steps,
+            "height": params.height,
+            "width": params.width,
+            "num_frames": params.num_frames,
+            "scheduler": params.scheduler,
+            "upscaled": quality in VIDEO_UPSCALE_QUALITIES,
+            "average_seconds": quality_latency.get(quality),
+        }
+        for quality, params in QUALITY_PRESETS.items()
+    ]
+
+
+# Queue depths and activity of both pipeline stages
+def generation_stage_stats():
+    return {
+        "generation": generation_queue.stats(),
+        "upscale": upscale_queue.stats(),
+        "encode": encode_stage.stats(),
+        "hls": hls_stage.stats(),
+        "admission": admission.stats(),
+    }
+
+
+job_progress = ProgressTracker()
+admission = AdmissionController()
+encode_stage = StagePool("video-encode", workers=VIDEO_ENCODE_WORKERS, max_pending=VIDEO_ENCODE_MAX_PENDING)
+hls_stage = StagePool("video-hls", workers=VIDEO_HLS_WORKERS, max_pending=VIDEO_HLS_MAX_PENDING)
+
+generation_queue = JobQueue(
+    run_generation_jobs,
+    workers=VIDEO_WORKERS,
+    name="video-generation",
+    batch_size=VIDEO_BATCH_SIZE,
+    batch_wait=VIDEO_BATCH_WAIT_MS / 1000,
+)
+upscale_queue = JobQueue(run_upscale_jobs, workers=VIDEO_UPSCALE_WORKERS, name="video-upscale")
+
+
+# Relative size of a job, the standard quality counts as 1
+def _job_cost(quality: str):
+    params = QUALITY_PRESETS.get(quality, DEFAULT_GENERATION_PARAMS)
+    base = DEFAULT_GENERATION_PARAMS
+    work = params.num_inference_steps * params.num_frames * params.height * params.width
+    return work / (base.num_inference_steps * base.num_frames * base.height * base.width)
+
+
+# Queue a job under its user's fair share, paid accounts get a larger weight and cap
+def _submit_job(db, job_id: int, user_id: int, quality: str, replaces: int = None):
+    user = crud.get_user(db, user_id)
+    paid = user is not None and user.paid_at is not None
+    job_progress.queued(job_id, quality)
+    if replaces is not None and generation_queue.replace(replaces, job_id, user_id):
+        return
+    generation_queue.submit(
+        job_id,
+        user_id,
+        weight=VIDEO_PAID_WEIGHT if paid else 1.0,
+        cost=_job_cost(quality),
+        cap=VIDEO_MAX_RUNNING_PER_PAID_USER if paid else VIDEO_MAX_RUNNING_PER_USER,
+    )
+
+
+# Rough wait before a queued job starts, from its position and recent generation times
+def _estimate_start_seconds(position: int, quality: str):
+    if position is None:
+        return None
+    average = quality_latency.get(quality or DEFAULT_QUALITY)
+    if average is None:
+        return None
+    parallel = generation_queue.workers * generation_queue.batch_size
+    return round((position // parallel + 1) * average, 1)
+
+
+# This process in the generation_workers table, set when the workers start so every
+# process forked by gunicorn gets its own
+worker_id = None
+
+
+# Beat for this process, then clean up after workers that stopped beating: their running
+# jobs can not be resumed and fail, their queued jobs and upscales move to this process.
+# Jobs of live sibling processes are left alone.
+def recover_orphaned_jobs():
+    db = SessionLocal()
+    try:
+        crud.beat_generation_worker(db, worker_id)
+        cutoff = datetime.now() - timedelta(seconds=VIDEO_WORKER_TIMEOUT_SECONDS)
+        live_worker_ids = crud.get_live_generation_workers(db, cutoff)
+        crud.fail_orphaned_generation_jobs(db, live_worker_ids, "Interrupted, the server running it stopped.")
+        crud.fail_stranded_upscales(db)
+        for job in crud.adopt_generation_jobs(db, live_worker_ids, worker_id):
+            _submit_job(db, job.id, job.user_id, job.quality)
+        for job in crud.adopt_generation_jobs(db, live_worker_ids, worker_id, upscales=True):
+            upscale_queue.submit(job.id, job.user_id)
+        # Followers left behind by a leader that ended without resolving them
+        settled = datetime.now() - timedelta(seconds=VIDEO_WORKER_HEARTBEAT_SECONDS)
+        for job in crud.get_stranded_generation_jobs(db, settled):
+            _lead_or_follow(db, job)
+        crud.remove_generation_workers(db, before=cutoff)
+    finally:
+        db.close()
+
+
+def _watch_workers():
+    while True:
+        time.sleep(VIDEO_WORKER_HEARTBEAT_SECONDS)
+        try:
+            recover_orphaned_jobs()
+        except Exception as watch_exec:
+            logging.exception(watch_exec)
+
+
+# Start the generation workers and pick up jobs left over by processes that stopped
+def start_generation_workers():
+    global worker_id
+
+    # Fail at startup rather than on the first finished video when storage is misconfigured
+    video_storage.get_storage_backend()
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    generation_queue.start()
+    upscale_queue.start()
+    recover_orphaned_jobs()
+    threading.Thread(target=_watch_workers, name="video-worker-watch", daemon=True).start()
+
+
+# Deregister this process on a clean shutdown, so the others take over its queued jobs
+# at their next beat instead of after VIDEO_WORKER_TIMEOUT_SECONDS
+def stop_generation_workers():
+    if worker_id is None:
+        return
+    db = SessionLocal()
+    try:
+        crud.remove_generation_workers(db, worker_id=worker_id)
+    finally:
+        db.close()
+
+
+# Queue a new generation job for the user, or answer it straight from the video cache
+async def create_video(text_prompt: str, user_id: int, db, quality: str = DEFAULT_QUALITY):
+
+    if quality not in QUALITY_PRESETS:
+        raise HTTPException(status_code=400, detail=f"Unknown quality '{quality}'.")
+    params = QUALITY_PRESETS[quality]
+
+    admission.check_user(user_id)
+
+    key = video_cache.cache_key(text_prompt, asdict(params))
+    cached = video_cache.lookup(db, key)
+    if cached is not None:
+        video_path = video_cache.copy_to(cached, video_storage.new_path())
+        await run_in_threadpool(video_storage.get_storage_backend().publish, video_path)
+        job = crud.create_generation_job(db, user_id, text_prompt, cache_key=key, quality=quality, worker_id=worker_id)
+        _complete_job(db, job, video_path, from_status=JOB_QUEUED)
+        await run_in_threadpool(_queue_hls, [(job.video_id, video_path)])
+        await run_in_threadpool(_queue_upscale, db, job)
+        return job
+
+    # Only new work counts against the queue limit, attaching to a run in flight is free
+    if crud.get_inflight_job(db, key) is None:
+        admission.check_queue(
+            generation_queue.depth(),
+            generation_queue.workers * generation_queue.batch_size,
+            quality_latency.average(),
+            user_id=user_id,
+        )
+
+    job = crud.create_generation_job(db, user_id, text_prompt, cache_key=key, quality=quality, worker_id=worker_id)
+
+    # Attach to an identical job that is already queued or running, in any process.
+    # Off the event loop, since it may wait for the lock on the leader's row.
+    await run_in_threadpool(_lead_or_follow, db, job)
+    return job
+
+
+# Report the state of one of the user's jobs
+async def get_job_status(job_id: int, user_id: int, db):
+
+    job = crud.get_generation_job(db, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    position = None
+    progress = job_progress.get(job.id)
+    if job.status == JOB_QUEUED and progress is not None:
+        position = generation_queue.position(progress.job_id)
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "quality": job.quality,
+        "queue_position": position,
+        "estimated_start_seconds": _estimate_start_seconds(position, job.quality),
+        "video_url": job.video_path,
+        "upscale_status": job.upscale_status,
+        "upscaled_video_url": job.upscaled_video_path,
+        "timings": json.loads(job.timings) if job.timings else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# Cancel one of the user's queued or running jobs
+async def cancel_job(job_id: int, user_id: int, db):
+
+    job = crud.get_generation_job(db, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.status in JOB_FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail="Job has already finished.")
+
+    if crud.cancel_generation_job(db, job.id, JOB_QUEUED):
+        job_progress.finished(job.id)
+        # A follower's leader carries on without it. A leader that never started hands
+        # its run, and its place in the queue, to the next identical request.
+        if job.inflight_key is not None:
+            await run_in_threadpool(_resolve_followers, db, job, None, None, job.id)
+
+    elif crud.cancel_generation_job(db, job.id, JOB_RUNNING):
+        # A running job may belong to another process. Its worker reads the cancellation from
+        # the job table within VIDEO_CANCEL_POLL_SECONDS and stops at the next denoising step,
+        # unless others wait on it. Progress streams read the cancelled row from now on,
+        # followers keep their own entries.
+        job_progress.finished(job.id)
+
+    else:
+        raise HTTPException(status_code=409, detail="Job has already finished.")
+
+    return {"job_id": job.id, "status": JOB_CANCELLED}
+
+
+# Current progress of a job as sent to streaming clients, reads the database once the job is finished
+def _progress_event(job_id: int):
+
+    progress = job_progress.get(job_id)
+    if progress is not None:
+        position = generation_queue.position(progress.job_id)
+        return {
+            "job_id": job_id,
+            "status": progress.status,
+            "step": progress.step,
+            "total_steps": progress.total_steps,
+            "eta_seconds": progress.eta_seconds(),
+            "queue_position": position,
+            "estimated_start_seconds": _estimate_start_seconds(position, progress.quality),
+            "video_url": None,
+        }
+
+    db = SessionLocal()
+    try:
+        job = crud.get_generation_job(db, job_id)
+        return {
+            "job_id": job_id,
+            "status": job.status,
+            "step": None,
+            "total_steps": None,
+            "eta_seconds": None,
+            "queue_position": None,
+            "estimated_start_seconds": None,
+            "video_url": job.video_path,
+            "upscale_status": job.upscale_status,
+            "error": job.error,
+        }
+    finally:
+        db.close()
+
+
+# Stream progress of one of the user's jobs as Server-Sent Events until it finishes
+async def stream_job_progress(job_id: int, user_id: int, db):
+
+    job = crud.get_generation_job(db, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events():
+        last_event = None
+        while True:
+            event = await run_in_threadpool(_progress_event, job_id)
+            if event != last_event:
+                yield f"data: {json.dumps(event)}\n\n"
+                last_event = event
+            if event["status"] in JOB_FINISHED_STATUSES:
+                break
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+
+# HLS playlist of one of the user's videos, segmenting it now if that never happened
+async def get_video_playlist(video_id: int, user_id: int, db):
+
+    video = db.query(Video).filter(Video.id == video_id).first()
+    if video is None or video.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Video not found.")
+
+    if video.hls_path and os.path.exists(video.hls_path):
+        return {"video_id": video.id, "status": "ready", "playlist_url": f"/{video.hls_path}"}
+
+    if not VIDEO_HLS or not hls_available():
+        raise HTTPException(status_code=404, detail="HLS playback is not available.")
+    if not video.video_path or not os.path.exists(video.video_path):
+        raise HTTPException(status_code=404, detail="Video file not found.")
+
+    await run_in_threadpool(_queue_hls, [(video.id, video.video_path)])
+    return {"video_id": video.id, "status": "processing", "playlist_url": None}
+
+
+# Make the poster and thumbnail of a video that has none, from its file
+def _ensure_previews(video_id: int, video_path: str):
+    poster_path, thumbnail_path = preview_paths(video_path)
+    if os.path.exists(poster_path) and os.path.exists(thumbnail_path):
+        return poster_path, thumbnail_path
+    poster_path, thumbnail_path = write_previews(read_poster_frame(video_path), video_path)
+
+    db = SessionLocal()
+    try:
+        video = db.query(Video).filter(Video.id == video_id).first()
+        video.poster_path, video.thumbnail_path = poster_path, thumbnail_path
+        db.commit()
+    finally:
+        db.close()
+    return poster_path, thumbnail_path
+
+
+# Thumbnail of one of the user's videos at one of the VIDEO_THUMBNAIL_SIZES widths, the default size without one
+async def get_video_thumbnail(video_id: int, user_id: int, db, request: Request, width: int = None):
+
+    video = db.query(Video).filter(Video.id == video_id).first()
+    if video is None or video.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Video not found.")
+    if width is not None and width not in VIDEO_THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Thumbnail width must be one of {VIDEO_THUMBNAIL_SIZES}.")
+    if not video.video_path or not os.path.exists(video.video_path):
+        raise HTTPException(status_code=404, detail="Video file not found.")
+
+    _, thumbnail_path = await run_in_threadpool(_ensure_previews, video.id, video.video_path)
+    if width is not None:
+        thumbnail_path = await run_in_threadpool(thumbnail_variant, video.video_path, width)
+
+    # Thumbnails of a video never change
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    return file_download_response(request, thumbnail_path, media_type="image/webp", headers=headers)
+
 
 # download video
-async def start_download_video(video_url: str):
+async def start_download_video(video_url: str, request: Request):
 
     if not video_url:
         raise HTTPException(status_code=400, detail="Video URL is missing or empty.")
 
-    # Assuming the video is stored in the local filesystem
-    video_path = video_url  # Assuming video_url contains the path to the video
+    # Only stored videos can be downloaded
+    video_path = os.path.realpath(video_url)
+    if not video_storage.is_stored(video_path):
+        raise HTTPException(status_code=404, detail="Video not found.")
+
+    # Object storage serves the bytes itself through a short-lived signed URL
+    redirect_url = video_storage.get_storage_backend().download_url(os.path.normpath(video_url), os.path.basename(video_path))
+    if redirect_url is not None:
+        return RedirectResponse(redirect_url, status_code=307)
 
-    if not os.path.exists(video_path):
+    if not os.path.isfile(video_path):
         raise HTTPException(status_code=404, detail="Video not found.")
 
     # Set content disposition to attachment to force download
@@ -67,4 +986,4 @@ async def start_download_video(video_url: str):
         "Content-Disposition": f"attachment; filename={os.path.basename(video_path)}"
     }
 
-    return Response(content=open(video_path, 'rb'), headers=headers, media_type='video/mp4')
+    return file_download_response(request, video_path, media_type='video/mp4', headers=headers)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_BACKEND = os.getenv("VIDEO_BACKEND", "diffusers")  # diffusers or stub
+VIDEO_STUB_LOAD_SECONDS = float(os.getenv("VIDEO_STUB_LOAD_SECONDS", 0))
+VIDEO_STUB_STEP_SECONDS = float(os.getenv("VIDEO_STUB_STEP_SECONDS", 0))
+# private: every process reads its own copy of the weights
+# mmap: safetensors weights are memory-mapped read-only, processes share their pages
+# preload: mmap, and the model is loaded before the server forks its workers
+VIDEO_WEIGHTS_MODE = os.getenv("VIDEO_WEIGHTS_MODE", "private")
+
+
+# What the generation workers need from a model: load it, turn a batch of prompts
+# into an intermediate result, stream each video's frames out of that result, release it.
+class InferenceBackend:
+
+    name = None
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+
+    def load(self):
+        pass
+
+    # Run the model for all prompts at once. callback(step, timestep, latents) is called
+    # after every step and may raise to stop the run. The text encoder is timed on timer,
+    # a StageTimer, when given. Returns an opaque batch result.
+    def generate(self, prompts: list, params, callback=None, timer=None):
+        raise NotImplementedError
+
+    # Rerun the model over existing videos at params' resolution, one prompt per video.
+    # videos are uint8 arrays of shape (frames, height, width, 3). Returns an opaque batch result.
+    def upscale(self, prompts: list, videos: list, params, callback=None):
+        raise NotImplementedError
+
+    # Yield uint8 frame chunks of shape (n, height, width, 3) for one video of the batch
+    def iter_frames(self, result, index: int, chunk_size: int = 4):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def describe(self):
+        return {"backend": self.name}
+
+
+# Deterministic synthetic frames in milliseconds, for load testing the queue, encode,
+# storage and database path on hosts without torch, diffusers or model weights.
+# VIDEO_STUB_STEP_SECONDS can stand in for the real per-step cost.
+class StubBackend(InferenceBackend):
+
+    name = "stub"
+
+    def load(self):
+        time.sleep(VIDEO_STUB_LOAD_SECONDS)
+
+    def generate(self, prompts: list, params, callback=None, timer=None):
+        for step in range(params.num_inference_steps):
+            time.sleep(VIDEO_STUB_STEP_SECONDS)
+            if callback is not None:
+                callback(step, None, None)
+
+        # The same prompt and parameters always give the same video
+        seeds = []
+        for prompt in prompts:
+            payload = json.dumps({"prompt": prompt, "params": params.__dict__}, sort_keys=True, default=str)
+            seeds.append(int(hashlib.sha256(payload.encode("utf-8")).hexdigest()[:8], 16))
+        return {"seeds": seeds, "params": params}
+
+    # Nearest neighbour resize of the input frames
+    def upscale(self, prompts: list, videos: list, params, callback=None):
+        import numpy as np
+
+        for step in range(params.num_inference_steps):
+            time.sleep(VIDEO_STUB_STEP_SECONDS)
+            if callback is not None:
+                callback(step, None, None)
+
+        upscaled = []
+        for video in videos:
+            rows = np.arange(params.height) * video.shape[1] // params.height
+            columns = np.arange(params.width) * video.shape[2] // params.width
+            upscaled.append(video[:, rows][:, :, columns])
+        return {"videos": upscaled}
+
+    # A colour gradient with a square moving across it
+    def iter_frames(self, result, index: int, chunk_size: int = 4):
+        import numpy as np
+
+        if "videos" in result:
+            video = result["videos"][index]
+            for start in range(0, len(video), chunk_size):
+                yield video[start:start + chunk_size]
+            return
+
+        params = result["params"]
+        rng = np.random.default_rng(result["seeds"][index])
+        base = rng.integers(0, 256, size=3)
+        gradient = np.linspace(0, 1, params.width, dtype=np.float32)[None, :, None]
+        background = (base * (0.5 + 0.5 * gradient)).astype(np.uint8)
+        size = max(params.height // 6, 1)
+
+        for start in range(0, params.num_frames, chunk_size):
+            count = min(chunk_size, params.num_frames - start)
+            frames = np.broadcast_to(background, (count, params.height, params.width, 3)).copy()
+            for offset in range(count):
+                frame_index = start + offset
+                x = (frame_index * 7) % max(params.width - size, 1)
+                y = (frame_index * 3) % max(params.height - size, 1)
+                frames[offset, y:y + size, x:x + size] = 255 - base
+            yield frames
+
+
+# Build and load the configured backend. The diffusers backend is imported only when
+# it is used, so the stub runs without torch installed and API processes that never
+# generate a video do not pay for importing it.
+def load_backend(model_id: str, name: str = None):
+    name = name or VIDEO_BACKEND
+    if name == "diffusers":
+        from diffusers_backend import DiffusersBackend
+        backend = DiffusersBackend(model_id)
+    elif name == "stub":
+        backend = StubBackend(model_id)
+    else:
+        raise ValueError(f"Unknown video backend '{name}', expected 'diffusers' or 'stub'.")
+    backend.load()
+    return backend
+
+
+# Same as load_backend for the video-to-video model of the upscale stage
+def load_upscale_backend(model_id: str, name: str = None):
+    name = name or VIDEO_BACKEND
+    if name == "diffusers":
+        from diffusers_backend import DiffusersUpscaleBackend
+        backend = DiffusersUpscaleBackend(model_id)
+    elif name == "stub":
+        backend = StubBackend(model_id)
+    else:
+        raise ValueError(f"Unknown video backend '{name}', expected 'diffusers' or 'stub'.")
+    backend.load()
+    return backend
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import VideoCacheEntry
+import video_storage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_CACHE_DIR = os.getenv("VIDEO_CACHE_DIR", "static/output_video/cache")
+VIDEO_CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+
+# Lower case and collapse whitespace so trivially different prompts share an entry
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+# Content address of a generation: hash of the normalized prompt and every parameter
+def cache_key(prompt: str, params: dict) -> str:
+    payload = json.dumps({"prompt": normalize_prompt(prompt), "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(VIDEO_CACHE_DIR, key[:2], f"{key}.mp4")
+
+
+# Give the destination its own name for the file, hard linked when the filesystem allows it
+def link_or_copy(source: str, destination: str) -> str:
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temporary = video_storage.temporary_path(destination)
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    return video_storage.commit(temporary, destination)
+
+
+# Find a cached video and mark it as recently used, None on a miss
+def lookup(db: Session, key: str):
+    entry = db.query(VideoCacheEntry).filter(VideoCacheEntry.cache_key == key).first()
+    if entry is None:
+        return None
+
+    # The index can outlive its file if someone cleaned the directory by hand
+    if not os.path.exists(entry.video_path):
+        db.delete(entry)
+        db.commit()
+        return None
+
+    entry.hits += 1
+    entry.last_accessed_at = datetime.now()
+    db.commit()
+    return entry
+
+
+# Materialise a cached video at output_path without touching the model
+def copy_to(entry: VideoCacheEntry, output_path: str) -> str:
+    return link_or_copy(entry.video_path, output_path)
+
+
+# Add a freshly generated video to the cache and evict old entries past the size limit
+def store(db: Session, key: str, video_path: str):
+    existing = db.query(VideoCacheEntry).filter(VideoCacheEntry.cache_key == key).first()
+    if existing is not None and os.path.exists(existing.video_path):
+        return existing
+
+    cached_path = _cache_path(key)
+    link_or_copy(video_path, cached_path)
+
+    entry = existing or VideoCacheEntry(cache_key=key)
+    entry.video_path = cached_path
+    entry.byte_size = os.path.getsize(cached_path)
+    entry.last_accessed_at = datetime.now()
+    db.add(entry)
+    db.commit()
+
+    evict(db)
+    return entry
+
+
+# Drop least recently used entries until the cache fits in VIDEO_CACHE_MAX_BYTES
+def evict(db: Session, max_bytes: int = VIDEO_CACHE_MAX_BYTES):
+    total = db.query(func.coalesce(func.sum(VideoCacheEntry.byte_size), 0)).scalar()
+    if total <= max_bytes:
+        return
+
+    entries = db.query(VideoCacheEntry).order_by(VideoCacheEntry.last_accessed_at).all()
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        # Users' copies are separate links, so removing the cache's name is safe
+        try:
+            os.remove(entry.video_path)
+        except FileNotFoundError:
+            pass
+        except OSError as remove_exec:
+            logging.warning(f"Could not evict cached video {entry.video_path}: {remove_exec}")
+            continue
+        total -= entry.byte_size
+        db.delete(entry)
+    db.commit()
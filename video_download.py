@@ -0,0 +1,163 @@
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("DOWNLOAD_CHUNK_BYTES", 256 * 1024))  # read size, the most a connection holds in memory
+DOWNLOAD_MAX_RANGES = int(os.getenv("DOWNLOAD_MAX_RANGES", 16))  # more ranges than this get the whole file
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+# Byte ranges asked for by a Range header as inclusive (start, end) pairs.
+# Returns None when the header should be ignored and the whole file sent.
+def parse_range(header: str, size: int):
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+            else:
+                # Suffix range, the last N bytes
+                start = max(size - int(last), 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            # Starts past the end of the file, unsatisfiable whatever the end is
+            continue
+        if start > end or start < 0:
+            return None
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > DOWNLOAD_MAX_RANGES:
+        return None
+    return ranges
+
+
+def _etag(stat_result):
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+# Whether the client's cached copy, described by If-None-Match or If-Modified-Since, is current
+def _not_modified(request: Request, etag: str, mtime: float):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# If-Range only allows a partial response while the client's copy is still the current one
+def _range_allowed(request: Request, etag: str, last_modified: str):
+    if_range = request.headers.get("if-range")
+    return if_range is None or if_range.strip() in (etag, last_modified)
+
+
+# Sends parts of a file without ever holding more than one chunk of it in memory.
+# Servers that offer the ASGI zero-copy send extension get the file descriptor and
+# send the bytes with sendfile, everyone else gets chunks read with pread.
+class FileRangeResponse(Response):
+
+    def __init__(self, path: str, parts: list, status_code: int, headers: dict, media_type: str = None, trailer: bytes = b""):
+        self.path = path
+        self.parts = parts  # (prefix bytes, start, length) per part
+        self.trailer = trailer
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            for prefix, start, length in self.parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if zero_copy:
+                    await send({"type": "http.response.zerocopysend", "file": file, "offset": start, "count": length, "more_body": True})
+                    continue
+                end = start + length
+                while start < end:
+                    chunk = await run_in_threadpool(os.pread, file.fileno(), min(DOWNLOAD_CHUNK_BYTES, end - start), start)
+                    if not chunk:
+                        break
+                    start += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
+        finally:
+            await run_in_threadpool(file.close)
+
+
+# Download response for a file honouring Range, If-Range, If-None-Match and If-Modified-Since
+def file_download_response(request: Request, path: str, media_type: str, headers: dict = None):
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    etag = _etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {**(headers or {}), "ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"}
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header and _range_allowed(request, etag, last_modified):
+        try:
+            ranges = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        return FileRangeResponse(path, [(b"", 0, size)], 200, headers, media_type)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return FileRangeResponse(path, [(b"", start, end - start + 1)], 206, headers, media_type)
+
+    # Several ranges go out as one multipart/byteranges body
+    boundary = secrets.token_hex(16)
+    parts = []
+    for index, (start, end) in enumerate(ranges):
+        prefix = (
+            ("\r\n" if index else "") + f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((prefix, start, end - start + 1))
+    trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    headers["Content-Length"] = str(sum(len(prefix) + length for prefix, _, length in parts) + len(trailer))
+    return FileRangeResponse(path, parts, 206, headers, trailer=trailer)
@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+import time
+import video_storage
+
+
+VIDEO_FPS = 8
+
+
+# Writes an mp4 incrementally while frames are still being decoded. Encoding runs on
+# the given executor (a thread of its own if none), at most max_pending chunks are buffered.
+# After finish() the file is completed in the background and on_finished(path) is called
+# from the encoding thread, with None as the path if encoding failed. The file is written
+# under a temporary name and only renamed to output_path once it is complete.
+# OpenCV is imported on first use so API processes that never encode do not load it.
+class StreamingVideoWriter:
+
+    def __init__(self, output_path: str, width: int, height: int, fps: int = VIDEO_FPS, max_pending: int = 2, executor=None, on_finished=None):
+        self.output_path = output_path
+        import cv2
+
+        self.on_finished = on_finished
+        self._temporary_path = video_storage.temporary_path(output_path)
+        self._writer = cv2.VideoWriter(self._temporary_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Could not open video writer for {output_path}")
+        self._chunks = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._aborted = False
+        self._done = threading.Event()
+        self.frames_written = 0
+        self.encode_seconds = 0.0
+        if executor is not None:
+            executor.submit(self._run)
+        else:
+            threading.Thread(target=self._run, name="video-encoder", daemon=True).start()
+
+    def _run(self):
+        import cv2
+
+        try:
+            while True:
+                frames = self._chunks.get()
+                if frames is None:
+                    break
+                if self._error is not None or self._aborted:
+                    continue
+                started = time.perf_counter()
+                try:
+                    for frame in frames:
+                        self._writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                        self.frames_written += 1
+                except Exception as encode_exec:
+                    self._error = encode_exec
+                self.encode_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            self._writer.release()
+            self.encode_seconds += time.perf_counter() - started
+
+            # Do not leave a truncated video behind
+            if self._error is not None or self._aborted:
+                if os.path.exists(self._temporary_path):
+                    os.remove(self._temporary_path)
+            else:
+                video_storage.commit(self._temporary_path, self.output_path)
+        finally:
+            self._done.set()
+
+        if self.on_finished is not None and not self._aborted:
+            self.on_finished(None if self._error is not None else self.output_path)
+
+    # Queue a chunk of RGB uint8 frames, blocks while the encoder is behind
+    def write(self, frames):
+        if self._error is not None:
+            raise self._error
+        self._chunks.put(frames)
+
+    # No more frames, the file is completed in the background
+    def finish(self):
+        self._chunks.put(None)
+
+    # Finish the file and wait for it, returns its path
+    def close(self):
+        self.finish()
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self.output_path
+
+    def __enter__(self):
+        return self
+
+    # Without on_finished the block waits for the file, otherwise it completes in the background
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            if self.on_finished is not None:
+                self.finish()
+            else:
+                self.close()
+        else:
+            self._aborted = True
+            self.finish()
+            self._done.wait()
+        return False
+
+
+# All frames of a video file as one RGB uint8 array of shape (frames, height, width, 3)
+def read_video_frames(path: str):
+    import cv2
+    import numpy as np
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video {path}")
+    frames = []
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        capture.release()
+    if not frames:
+        raise RuntimeError(f"No frames in video {path}")
+    return np.stack(frames)
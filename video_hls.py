@@ -0,0 +1,70 @@
+import os
+import shutil
+import subprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+VIDEO_HLS_SEGMENT_SECONDS = int(os.getenv("VIDEO_HLS_SEGMENT_SECONDS", 1))
+VIDEO_HLS_TIMEOUT_SECONDS = int(os.getenv("VIDEO_HLS_TIMEOUT_SECONDS", 300))
+
+PLAYLIST_NAME = "index.m3u8"
+
+
+# Segmenting is skipped on hosts without ffmpeg, the mp4 download keeps working
+def hls_available():
+    return shutil.which(FFMPEG_BINARY) is not None
+
+
+# Split an mp4 into H.264 HLS segments plus a VOD playlist in output_dir, returns the playlist path.
+# The mp4v files written by OpenCV can not be played by HLS players, so the video is re-encoded.
+# Everything is written to a temporary directory first, so a playlist never lists missing segments.
+def segment_video(video_path: str, output_dir: str, fps: int, segment_seconds: int = VIDEO_HLS_SEGMENT_SECONDS):
+    staging_dir = f"{output_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    command = [
+        FFMPEG_BINARY, "-y", "-loglevel", "error",
+        "-i", video_path,
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        # A keyframe at every segment boundary so each segment starts playback on its own
+        "-g", str(fps * segment_seconds), "-keyint_min", str(fps * segment_seconds), "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(staging_dir, "segment_%03d.ts"),
+        os.path.join(staging_dir, PLAYLIST_NAME),
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=VIDEO_HLS_TIMEOUT_SECONDS)
+    except subprocess.CalledProcessError as ffmpeg_exec:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise RuntimeError(f"ffmpeg failed for {video_path}: {ffmpeg_exec.stderr.decode(errors='replace')[-500:]}")
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(staging_dir, output_dir)
+    return os.path.join(output_dir, PLAYLIST_NAME)
+
+
+# Give another video with the same file the segments of an already segmented one
+def link_segments(source_dir: str, output_dir: str):
+    staging_dir = f"{output_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    for name in os.listdir(source_dir):
+        source = os.path.join(source_dir, name)
+        try:
+            os.link(source, os.path.join(staging_dir, name))
+        except OSError:
+            shutil.copyfile(source, os.path.join(staging_dir, name))
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(staging_dir, output_dir)
+    return os.path.join(output_dir, PLAYLIST_NAME)
+
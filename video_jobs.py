@@ -0,0 +1,227 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from video_scheduler import FairScheduler
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_FINISHED_STATUSES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+# Raised from the pipeline callback to stop a run nobody is waiting for any more
+class JobCancelled(Exception):
+    pass
+
+
+# Runs queued job ids on a pool of worker threads so request handlers return immediately.
+# Jobs are served fairly across users by a FairScheduler. Each worker hands its handler
+# a list of up to batch_size job ids, waiting at most batch_wait seconds after the first
+# one for more to arrive.
+class JobQueue:
+
+    def __init__(self, handler, workers: int = 1, name: str = "video-worker", batch_size: int = 1, batch_wait: float = 0.0):
+        if workers < 1:
+            raise ValueError("A job queue needs at least one worker.")
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least one.")
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = FairScheduler()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    # Start the worker threads, safe to call more than once
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # weight scales the user's share of the workers, cost is the job's relative size
+    # and cap limits how many of the user's jobs run at once
+    def submit(self, job_id: int, user_id=None, weight: float = 1.0, cost: float = 1.0, cap: int = None):
+        self._queue.put(job_id, user_id, weight=weight, cost=cost, cap=cap)
+
+    # Number of jobs waiting for a worker
+    def depth(self):
+        return self._queue.qsize()
+
+    # Zero based place of a job in the queue, None once a worker has taken it
+    def position(self, job_id: int):
+        return self._queue.position(job_id)
+
+    # Swap a queued job for another one in the same place, False if it is no longer queued
+    def replace(self, job_id: int, new_job_id: int, user_id=None):
+        return self._queue.replace(job_id, new_job_id, user_id)
+
+    # Block for one job, then gather more until the batch is full or the wait runs out
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def stats(self):
+        return {"name": self.name, "workers": self.workers, "busy": self._busy, "queued": self.depth()}
+
+    def _run(self):
+        while True:
+            job_ids = self._next_batch()
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                self.handler(job_ids)
+            except Exception:
+                # The handler records failures on the jobs, this only keeps the worker alive
+                logging.exception(f"Unhandled error in jobs {job_ids}")
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+                for job_id in job_ids:
+                    self._queue.task_done(job_id)
+
+
+# A bounded thread pool for one stage of the generation pipeline.
+# submit() blocks once max_pending tasks are queued or running, which pushes back
+# on the stage before it instead of letting work pile up in memory.
+class StagePool:
+
+    def __init__(self, name: str, workers: int = 1, max_pending: int = None):
+        if workers < 1:
+            raise ValueError("A stage needs at least one worker.")
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.Semaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(self._run, fn, *args, **kwargs)
+        except Exception:
+            self._release(started=False)
+            raise
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(started=True)
+
+    def _release(self, started: bool):
+        with self._lock:
+            if started:
+                self._running -= 1
+                self._completed += 1
+            else:
+                self._pending -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": self._pending,
+                "running": self._running,
+                "completed": self._completed,
+            }
+
+
+# Live progress of queued and running jobs, kept in memory for streaming to clients.
+# Writers only touch a few fields per denoising step so the callback stays cheap.
+class JobProgress:
+
+    def __init__(self, job_id: int, quality: str = None):
+        self.job_id = job_id  # the job that actually runs, the leader for followers
+        self.quality = quality
+        self.status = JOB_QUEUED
+        self.step = 0
+        self.total_steps = None
+        self.started_at = None
+        self.updated_at = time.monotonic()
+
+    def eta_seconds(self):
+        if self.started_at is None or not self.step or not self.total_steps:
+            return None
+        per_step = (time.monotonic() - self.started_at) / self.step
+        return round(per_step * (self.total_steps - self.step), 1)
+
+
+class ProgressTracker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def queued(self, job_id: int, quality: str = None):
+        with self._lock:
+            self._jobs[job_id] = JobProgress(job_id, quality)
+
+    # Followers share the leader's progress object
+    def follow(self, job_id: int, leader_id: int):
+        with self._lock:
+            progress = self._jobs.get(leader_id)
+            if progress is not None:
+                self._jobs[job_id] = progress
+
+    def started(self, job_ids: list, total_steps: int):
+        now = time.monotonic()
+        with self._lock:
+            for job_id in job_ids:
+                progress = self._jobs.setdefault(job_id, JobProgress(job_id))
+                progress.status = JOB_RUNNING
+                progress.total_steps = total_steps
+                progress.started_at = now
+                progress.updated_at = now
+
+    # Called from the pipeline callback once per denoising step
+    def step(self, job_ids: list, step: int):
+        now = time.monotonic()
+        for job_id in job_ids:
+            progress = self._jobs.get(job_id)
+            if progress is not None:
+                progress.step = step
+                progress.updated_at = now
+
+    # Finished jobs are read back from the database
+    def finished(self, job_id: int):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id: int):
+        return self._jobs.get(job_id)
@@ -0,0 +1,162 @@
+import gc
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from video_backends import load_backend, VIDEO_WEIGHTS_MODE
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_MODEL_ID = os.getenv("VIDEO_MODEL_ID", "cerspense/zeroscope_v2_576w")
+VIDEO_PIPELINE_REPLICAS = int(os.getenv("VIDEO_PIPELINE_REPLICAS", 1))
+
+
+# A single loaded copy of a model, only used by one request at a time
+class PipelineReplica:
+
+    def __init__(self, index: int):
+        self.index = index
+        self.backend = None
+        self.lock = threading.Lock()
+        self.load_seconds = None
+        self.uses = 0
+
+
+# Keeps a fixed number of warm replicas of one model for the whole process
+class PipelinePool:
+
+    def __init__(self, model_id: str, replicas: int = 1, loader=load_backend):
+        if replicas < 1:
+            raise ValueError("A pipeline pool needs at least one replica.")
+        self.model_id = model_id
+        self.loader = loader
+        self.replicas = [PipelineReplica(index) for index in range(replicas)]
+        self._available = threading.Semaphore(replicas)
+        self._stats_lock = threading.Lock()
+        self.loads = 0
+        self.reuses = 0
+
+    # Borrow a free replica's backend, loading its model on first use
+    @contextmanager
+    def acquire(self):
+        self._available.acquire()
+        replica = None
+        try:
+            # The semaphore guarantees at least one replica lock is free
+            for candidate in self.replicas:
+                if candidate.lock.acquire(blocking=False):
+                    replica = candidate
+                    break
+            if replica.backend is None:
+                started = time.perf_counter()
+                replica.backend = self.loader(self.model_id)
+                replica.load_seconds = time.perf_counter() - started
+                with self._stats_lock:
+                    self.loads += 1
+            else:
+                with self._stats_lock:
+                    self.reuses += 1
+            replica.uses += 1
+            yield replica.backend
+        finally:
+            if replica is not None:
+                replica.lock.release()
+            self._available.release()
+
+    # Load every replica up front so the first requests do not pay for it
+    def warm_up(self):
+        for _ in self.replicas:
+            with self.acquire():
+                pass
+
+    # Unload every replica once it is idle, they are loaded again on next use
+    def release(self):
+        for replica in self.replicas:
+            with self._available:
+                with replica.lock:
+                    if replica.backend is not None:
+                        replica.backend.release()
+                        replica.backend = None
+
+    def stats(self):
+        with self._stats_lock:
+            loads, reuses = self.loads, self.reuses
+        return {
+            "model_id": self.model_id,
+            "replicas": len(self.replicas),
+            "loads": loads,
+            "reuses": reuses,
+            "replica_stats": [
+                {
+                    "index": replica.index,
+                    "loaded": replica.backend is not None,
+                    **(replica.backend.describe() if replica.backend is not None else {}),
+                    "busy": replica.lock.locked(),
+                    "load_seconds": replica.load_seconds,
+                    "uses": replica.uses,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+
+# Process-wide registry, one pool per model id
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pipeline_pool(model_id: str = VIDEO_MODEL_ID, replicas: int = VIDEO_PIPELINE_REPLICAS, loader=load_backend):
+    with _pools_lock:
+        pool = _pools.get(model_id)
+        if pool is None:
+            pool = PipelinePool(model_id, replicas, loader)
+            _pools[model_id] = pool
+        return pool
+
+
+# Stats for every model that has been requested in this process
+def pipeline_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+# Unload every model, used on shutdown
+def release_pipelines():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.release()
+
+
+# Load the default model in the server's master process before it forks its workers
+# (gunicorn --preload), so they inherit its pages copy-on-write instead of loading their own.
+# Objects that exist now are frozen out of the garbage collector, whose bookkeeping
+# would otherwise write to and unshare their pages in every worker.
+def preload_pipelines():
+    get_pipeline_pool().warm_up()
+    gc.collect()
+    gc.freeze()
+
+
+# Resident memory of this worker process and how much of it is shared with other processes, in MB
+def process_memory():
+    usage = {"pid": os.getpid(), "weights_mode": VIDEO_WEIGHTS_MODE}
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                field, _, value = line.partition(":")
+                if field in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[field.lower() + "_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        # No smaps outside Linux, the peak resident size is all we can get
+        usage["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return usage
+
+    usage["shared_mb"] = round(usage.get("shared_clean_mb", 0) + usage.get("shared_dirty_mb", 0), 1)
+    usage["private_mb"] = round(usage.get("private_clean_mb", 0) + usage.get("private_dirty_mb", 0), 1)
+    return usage
@@ -0,0 +1,81 @@
+import os
+from dotenv import load_dotenv
+from video_cache import link_or_copy
+from video_storage import sibling_path, temporary_path, commit
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_POSTER_QUALITY = int(os.getenv("VIDEO_POSTER_QUALITY", 85))
+VIDEO_THUMBNAIL_WIDTH = int(os.getenv("VIDEO_THUMBNAIL_WIDTH", 320))
+# Widths that can be asked for on demand, each one is cached on disk once made
+VIDEO_THUMBNAIL_SIZES = [int(width) for width in os.getenv("VIDEO_THUMBNAIL_SIZES", "64,128,160,240,320").split(",") if width.strip()]
+
+
+# Poster and default thumbnail file names, stored next to the video
+def preview_paths(video_path: str):
+    return sibling_path(video_path, "_poster.jpg"), sibling_path(video_path, "_thumb.webp")
+
+
+def thumbnail_variant_path(video_path: str, width: int):
+    return sibling_path(video_path, f"_thumb_{width}.webp")
+
+
+def _save(image, path: str, format: str, **options):
+    temporary = temporary_path(path)
+    image.save(temporary, format=format, **options)
+    commit(temporary, path)
+
+
+def _resized(image, width: int):
+    from PIL import Image
+
+    height = max(round(image.height * width / image.width), 1)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+# Write the poster JPEG and thumbnail WebP for a video from one RGB uint8 frame
+def write_previews(frame, video_path: str):
+    from PIL import Image
+
+    poster_path, thumbnail_path = preview_paths(video_path)
+    image = Image.fromarray(frame)
+    _save(image, poster_path, "JPEG", quality=VIDEO_POSTER_QUALITY)
+    _save(_resized(image, min(VIDEO_THUMBNAIL_WIDTH, image.width)), thumbnail_path, "WEBP", quality=80)
+    return poster_path, thumbnail_path
+
+
+# The middle frame of a video file, for videos that got no previews when they were encoded
+def read_poster_frame(video_path: str):
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.set(cv2.CAP_PROP_POS_FRAMES, max(frame_count // 2, 0))
+        ok, frame = capture.read()
+    finally:
+        capture.release()
+    if not ok:
+        raise RuntimeError(f"Could not read a frame from {video_path}")
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+# A thumbnail of the given width, made from the poster the first time it is asked for
+def thumbnail_variant(video_path: str, width: int):
+    from PIL import Image
+
+    path = thumbnail_variant_path(video_path, width)
+    if not os.path.exists(path):
+        poster_path, _ = preview_paths(video_path)
+        with Image.open(poster_path) as poster:
+            _save(_resized(poster.convert("RGB"), min(width, poster.width)), path, "WEBP", quality=80)
+    return path
+
+
+# Give a copy of a video the previews of the original
+def link_previews(source_video_path: str, video_path: str):
+    for source, target in zip(preview_paths(source_video_path), preview_paths(video_path)):
+        if os.path.exists(source):
+            link_or_copy(source, target)
@@ -0,0 +1,109 @@
+import queue
+import threading
+from collections import deque
+
+
+# Weighted fair queuing of generation jobs across users (start-time fair queuing).
+# Every job gets a virtual finish tag of start + cost / weight, where start is the later
+# of the scheduler's virtual time and the user's previous tag. Workers always take the
+# eligible job with the smallest tag, so a user who floods the queue only delays their
+# own jobs, and a user with twice the weight gets twice the share while both are backlogged.
+# A user whose running job count has reached their cap is skipped until one finishes.
+class FairScheduler:
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues = {}      # user_id -> deque of [start, finish, job_id]
+        self._last_finish = {}  # user_id -> finish tag of their latest job
+        self._caps = {}        # user_id -> max running jobs, None for no limit
+        self._running = {}     # user_id -> running job count
+        self._owners = {}      # job_id -> user_id, for queued and running jobs
+        self._virtual_time = 0.0
+        self._size = 0
+
+    def put(self, job_id: int, user_id=None, weight: float = 1.0, cost: float = 1.0, cap: int = None):
+        with self._cond:
+            start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+            finish = start + cost / weight
+            self._last_finish[user_id] = finish
+            self._queues.setdefault(user_id, deque()).append([start, finish, job_id])
+            self._caps[user_id] = cap
+            self._owners[job_id] = user_id
+            self._size += 1
+            self._cond.notify()
+
+    def _eligible_user(self):
+        best_user, best_finish = None, None
+        for user_id, jobs in self._queues.items():
+            if not jobs:
+                continue
+            cap = self._caps.get(user_id)
+            if cap is not None and self._running.get(user_id, 0) >= cap:
+                continue
+            if best_finish is None or jobs[0][1] < best_finish:
+                best_user, best_finish = user_id, jobs[0][1]
+        return best_user
+
+    # Same contract as queue.Queue.get, raises queue.Empty on timeout
+    def get(self, block: bool = True, timeout: float = None):
+        with self._cond:
+            if not block:
+                timeout = 0
+            if not self._cond.wait_for(lambda: self._eligible_user() is not None, timeout=timeout):
+                raise queue.Empty
+            user_id = self._eligible_user()
+            start, _, job_id = self._queues[user_id].popleft()
+            if not self._queues[user_id]:
+                del self._queues[user_id]
+            self._virtual_time = max(self._virtual_time, start)
+            owner = self._owners.get(job_id, user_id)
+            self._running[owner] = self._running.get(owner, 0) + 1
+            self._size -= 1
+            return job_id
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    # A worker finished the job, frees a slot under its user's cap
+    def task_done(self, job_id: int):
+        with self._cond:
+            user_id = self._owners.pop(job_id, None)
+            running = self._running.get(user_id, 0) - 1
+            if running > 0:
+                self._running[user_id] = running
+            else:
+                self._running.pop(user_id, None)
+                if user_id not in self._queues:
+                    # Idle users are forgotten, they start again from the current virtual time
+                    self._last_finish.pop(user_id, None)
+                    self._caps.pop(user_id, None)
+            self._cond.notify_all()
+
+    def qsize(self):
+        with self._cond:
+            return self._size
+
+    # Zero based place among all queued jobs in the order they would be served
+    def position(self, job_id: int):
+        with self._cond:
+            order = sorted(
+                (entry[1], entry[0], entry[2])
+                for jobs in self._queues.values()
+                for entry in jobs
+            )
+            for index, (_, _, queued_id) in enumerate(order):
+                if queued_id == job_id:
+                    return index
+            return None
+
+    # Give a queued job's slot to another job, which may belong to another user
+    def replace(self, job_id: int, new_job_id: int, user_id=None):
+        with self._cond:
+            for jobs in self._queues.values():
+                for entry in jobs:
+                    if entry[2] == job_id:
+                        entry[2] = new_job_id
+                        self._owners.pop(job_id, None)
+                        self._owners[new_job_id] = user_id
+                        return True
+            return False
@@ -0,0 +1,133 @@
+import functools
+import mimetypes
+import os
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Configuration
+VIDEO_STORAGE_ROOT = os.getenv("VIDEO_STORAGE_ROOT", "static/output_video")
+VIDEO_STORAGE_SHARD_LEVELS = int(os.getenv("VIDEO_STORAGE_SHARD_LEVELS", 2))  # two hex characters per level, 256 directories each
+VIDEO_STORAGE_BACKEND = os.getenv("VIDEO_STORAGE_BACKEND", "local")  # local or s3
+VIDEO_S3_BUCKET = os.getenv("VIDEO_S3_BUCKET")
+VIDEO_S3_PREFIX = os.getenv("VIDEO_S3_PREFIX", "")
+VIDEO_S3_ENDPOINT_URL = os.getenv("VIDEO_S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO, unset for AWS
+VIDEO_S3_REGION = os.getenv("VIDEO_S3_REGION")
+VIDEO_SIGNED_URL_SECONDS = int(os.getenv("VIDEO_SIGNED_URL_SECONDS", 3600))
+
+
+# A fresh, unique path for a new file. The name is a random id and the directories above
+# it are its leading hex characters, so files spread evenly and no directory grows too large.
+def new_path(extension: str = ".mp4") -> str:
+    file_id = uuid.uuid4().hex
+    shards = [file_id[level * 2:level * 2 + 2] for level in range(VIDEO_STORAGE_SHARD_LEVELS)]
+    directory = os.path.join(VIDEO_STORAGE_ROOT, *shards)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{file_id}{extension}")
+
+
+# Where a file is written before it is renamed into place. It keeps the extension,
+# which tools like OpenCV and ffmpeg use to pick the container.
+def temporary_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".tmp-{uuid.uuid4().hex[:8]}-{name}")
+
+
+# Move a finished temporary file to its final path in one step, readers never see a partial file
+def commit(temporary: str, path: str) -> str:
+    os.replace(temporary, path)
+    return path
+
+
+# Files and directories that belong to a video are stored next to it under its id
+def sibling_path(video_path: str, suffix: str) -> str:
+    base, _ = os.path.splitext(video_path)
+    return f"{base}{suffix}"
+
+
+# Whether a path points inside the storage root, used before serving files by path
+def is_stored(path: str) -> bool:
+    root = os.path.realpath(VIDEO_STORAGE_ROOT)
+    return os.path.commonpath([os.path.realpath(path), root]) == root
+
+
+# Facts about a finished video worth keeping in the database, so listings need no file access
+def video_metadata(path: str, width: int, height: int, fps: int, num_frames: int) -> dict:
+    return {
+        "byte_size": os.path.getsize(path),
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "duration_seconds": round(num_frames / fps, 3) if fps else None,
+    }
+
+
+# Where finished videos are kept for downloading. Workers always render to the local
+# storage root, then publish() the finished file to the backend.
+class LocalStorageBackend:
+
+    name = "local"
+
+    def publish(self, path: str):
+        pass
+
+    # None means the file is served by this process from the local disk
+    def download_url(self, path: str, filename: str):
+        return None
+
+
+# An S3 compatible bucket (AWS S3, MinIO, ...). Downloads are redirected to short-lived
+# signed URLs, so video bytes never pass through the API workers and API nodes need no
+# shared disk. boto3 is only needed, and imported, when this backend is configured.
+class S3StorageBackend:
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None, url_seconds: int = 3600):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("VIDEO_STORAGE_BACKEND=s3 needs boto3, install it with pip install boto3.")
+        if not bucket:
+            raise RuntimeError("VIDEO_STORAGE_BACKEND=s3 needs VIDEO_S3_BUCKET.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_seconds = url_seconds
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    # Object key of a stored file, its path under the storage root
+    def key(self, path: str) -> str:
+        return self.prefix + os.path.relpath(path, VIDEO_STORAGE_ROOT).replace(os.sep, "/")
+
+    def publish(self, path: str):
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.client.upload_file(path, self.bucket, self.key(path), ExtraArgs={"ContentType": content_type})
+
+    def download_url(self, path: str, filename: str):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(path),
+                "ResponseContentDisposition": f'attachment; filename="{filename}"',
+            },
+            ExpiresIn=self.url_seconds,
+        )
+
+
+# The configured backend, built on first use
+@functools.lru_cache(maxsize=None)
+def get_storage_backend():
+    if VIDEO_STORAGE_BACKEND == "local":
+        return LocalStorageBackend()
+    if VIDEO_STORAGE_BACKEND == "s3":
+        return S3StorageBackend(
+            VIDEO_S3_BUCKET,
+            prefix=VIDEO_S3_PREFIX,
+            endpoint_url=VIDEO_S3_ENDPOINT_URL,
+            region=VIDEO_S3_REGION,
+            url_seconds=VIDEO_SIGNED_URL_SECONDS,
+        )
+    raise ValueError(f"Unknown storage backend '{VIDEO_STORAGE_BACKEND}', expected 'local' or 's3'.")
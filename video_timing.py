@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Upper bounds in seconds of the denoising step histogram buckets, the last one catches the rest
+STEP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, float("inf"))
+
+STAGES = ("queue_wait", "acquire", "text_encode", "denoise", "decode", "export", "persist")
+
+
+def _bucket_label(bound: float):
+    return "+inf" if bound == float("inf") else f"{bound:g}"
+
+
+def _step_histogram(step_seconds: list):
+    counts = {_bucket_label(bound): 0 for bound in STEP_BUCKETS}
+    for seconds in step_seconds:
+        for bound in STEP_BUCKETS:
+            if seconds <= bound:
+                counts[_bucket_label(bound)] += 1
+                break
+    return counts
+
+
+# Wall time spent in each stage of one generation job.
+# Every stage and denoising step moves a mark, so a step's duration is the time since
+# the previous step or stage ended and does not include the text encoder.
+class StageTimer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.step_seconds = []
+        self._mark = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    # Close a stage that began at started, a perf_counter() value
+    def end(self, stage: str, started: float):
+        ended = time.perf_counter()
+        self.add(stage, ended - started)
+        self._mark = ended
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.end(name, started)
+
+    # Called from the pipeline callback after every denoising step
+    def step(self):
+        now = time.perf_counter()
+        with self._lock:
+            self.step_seconds.append(now - self._mark)
+        self._mark = now
+
+    # A copy for one job of a batch, the shared stages so far carry over
+    def fork(self):
+        timer = StageTimer()
+        with self._lock:
+            timer.durations = dict(self.durations)
+            timer.step_seconds = list(self.step_seconds)
+        return timer
+
+    def to_dict(self):
+        with self._lock:
+            durations = dict(self.durations)
+            steps = list(self.step_seconds)
+        if steps:
+            durations["denoise"] = sum(steps)
+        return {
+            "stages": {stage: round(seconds, 4) for stage, seconds in durations.items()},
+            "steps": {
+                "count": len(steps),
+                "mean": round(sum(steps) / len(steps), 4) if steps else None,
+                "min": round(min(steps), 4) if steps else None,
+                "max": round(max(steps), 4) if steps else None,
+                "histogram": _step_histogram(steps),
+            },
+        }
+
+
+# Stage timings of the most recent jobs, summarised for the stats endpoint
+class TimingStats:
+
+    def __init__(self, max_jobs: int = 1000):
+        self._lock = threading.Lock()
+        self._jobs = deque(maxlen=max_jobs)  # (quality, stage durations)
+        self._step_counts = {}  # quality -> histogram over all recorded steps
+
+    # timings as returned by StageTimer.to_dict()
+    def record(self, quality: str, timings: dict):
+        with self._lock:
+            self._jobs.append((quality, timings["stages"]))
+            histogram = self._step_counts.setdefault(quality, {_bucket_label(bound): 0 for bound in STEP_BUCKETS})
+            for label, count in timings["steps"]["histogram"].items():
+                histogram[label] += count
+
+    def summary(self):
+        with self._lock:
+            jobs = list(self._jobs)
+            step_counts = {quality: dict(histogram) for quality, histogram in self._step_counts.items()}
+
+        by_quality = {}
+        for quality, stages in jobs:
+            for stage, seconds in stages.items():
+                by_quality.setdefault(quality, {}).setdefault(stage, []).append(seconds)
+
+        summary = {}
+        for quality, stages in by_quality.items():
+            summary[quality] = {"stages": {}, "step_histogram": step_counts.get(quality)}
+            for stage in sorted(stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+                values = sorted(stages[stage])
+                summary[quality]["stages"][stage] = {
+                    "count": len(values),
+                    "mean": round(sum(values) / len(values), 4),
+                    "p50": values[len(values) // 2],
+                    "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+                }
+        return {"jobs": len(jobs), "qualities": summary}
+
+
+stage_timings = TimingStats()